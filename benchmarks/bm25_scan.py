@@ -0,0 +1,96 @@
+"""
+Benchmark for BM25 retrieval: number of rows scanned and scored versus corpus size, taken from EXPLAIN ANALYZE.
+
+Compares the previous query (scoring every publication and filtering by date afterwards) with the query of
+PublicationRepository.get_openalex_ids_by_bm25_similarity in each DateFilterMode, for date windows of varying
+selectivity. Run from the repository root, e.g. `python -m benchmarks.bm25_scan --query "llm rerankers" --n 100`.
+Build the BM25 index first (`python setup/maintenance.py build-indexes --bm25`) to include index scans.
+"""
+
+import argparse
+import time
+
+from sqlalchemy import text
+
+from core.repositories import DateFilterMode
+from core.repositories.publication_repository import PublicationRepository
+from core.repositories.vector_index import vector_search_params
+from db import Session
+
+SELECTIVITIES = [0.01, 0.1, 0.5, 1.0]
+
+# the query used before the filters were moved into the scoring subquery
+PREVIOUS_QUERY = """
+SELECT openalex_id, score
+FROM
+(
+    SELECT openalex_id, publication.publication_datetime_utc,
+            -(bm25 <#> CAST(:query_vector AS sparsevec)) AS score
+    FROM publication
+) subquery
+WHERE score != double precision 'NaN'
+AND publication_datetime_utc >= :start_date
+ORDER BY score DESC
+LIMIT :top_n
+"""
+
+
+def rows_scanned(plan: dict) -> int:
+    # rows read from tables and indexes, including the rows filtered out. A bitmap scan is counted once, by its heap
+    # scan, and scans of CTEs re-read rows that were already counted
+    scanned = 0
+    reads_relation = "Relation Name" in plan or "Index Name" in plan
+    if reads_relation and plan["Node Type"] not in ("CTE Scan", "Bitmap Index Scan"):
+        scanned += (plan.get("Actual Rows", 0) + plan.get("Rows Removed by Filter", 0)) * plan.get("Actual Loops", 1)
+    for child in plan.get("Plans", []):
+        scanned += rows_scanned(child)
+    return scanned
+
+
+def explain(session, query: str, params: dict) -> tuple[int, float]:
+    start = time.perf_counter()
+    plan = session.execute(text(f"EXPLAIN (ANALYZE, FORMAT JSON) {query}"), params).scalar()
+    elapsed = (time.perf_counter() - start) * 1000
+    return rows_scanned(plan[0]["Plan"]), elapsed
+
+
+def main(query: str, n: int):
+    with Session() as session:
+        repository = PublicationRepository(session)
+        corpus_size = repository.count()
+        query_vector = repository.get_bm25_query_vector(query)
+        print(f"Corpus size: {corpus_size}, n={n}")
+
+        print(f"{'selectivity':>11} {'method':<20} {'rows scanned':>13} {'% of corpus':>12} {'time (ms)':>10}")
+        for selectivity in SELECTIVITIES:
+            start_date = session.execute(
+                text(
+                    "SELECT percentile_disc(:fraction) WITHIN GROUP (ORDER BY publication_datetime_utc) "
+                    "FROM publication"
+                ),
+                {"fraction": 1 - selectivity},
+            ).scalar()
+            params = {"query_vector": query_vector, "top_n": n, "start_date": start_date}
+            results = {"previous": explain(session, PREVIOUS_QUERY, params)}
+
+            for mode in DateFilterMode:
+                query_text, params, search_params = repository._bm25_search_query(
+                    query_vector, n, start_date, None, mode, 0.05, None
+                )
+                with vector_search_params(session, **search_params):
+                    results[f"current ({mode.value})"] = explain(session, query_text.text, params)
+
+            for name, (scanned, elapsed) in results.items():
+                print(
+                    f"{selectivity:>11.2f} {name:<20} {scanned:>13,} {scanned / max(corpus_size, 1):>12.1%} "
+                    f"{elapsed:>10.1f}"
+                )
+            session.rollback()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark rows scanned by BM25 retrieval.")
+    parser.add_argument("--query", type=str, default="llm rerankers", help="Query to search for.")
+    parser.add_argument("--n", type=int, default=100, help="Number of results.")
+    args = parser.parse_args()
+    main(args.query, args.n)
@@ -0,0 +1,85 @@
+"""
+Benchmark for ingesting publications: per-row ORM inserts (PublicationRepository.create) versus
+PublicationRepository.bulk_create via multi-row INSERT and via binary COPY.
+
+Inserts synthetic publications with negative OpenAlex ids (which never occur in OpenAlex) into the configured database
+and deletes them afterwards. Run from the repository root, e.g. `python -m benchmarks.bulk_ingest --n 10000`.
+"""
+
+import argparse
+import datetime
+import random
+import time
+
+from sqlalchemy import delete
+
+from core.repositories.publication_repository import PublicationRepository
+from core.sqlalchemy_models import Publication
+from db import Session
+
+EMBEDDING_DIMENSIONS = 1024
+
+
+def synthetic_rows(n: int, first_id: int, seed: int = 42) -> list[dict]:
+    rng = random.Random(seed)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return [
+        {
+            "openalex_id": first_id - i,
+            "title": f"Synthetic publication {i}",
+            "authors": ["Author A", "Author B", "Author C"],
+            "abstract": " ".join(rng.choices(["retrieval", "ranking", "embedding", "language", "model"], k=200)),
+            "publication_datetime_utc": now - datetime.timedelta(days=rng.randint(0, 1000)),
+            "accessed_datetime_utc": now,
+            "embedding": [rng.random() for _ in range(EMBEDDING_DIMENSIONS)],
+        }
+        for i in range(n)
+    ]
+
+
+def ingest_orm(repository: PublicationRepository, rows: list[dict]):
+    for row in rows:
+        repository.create(
+            openalex_id=row["openalex_id"],
+            title=row["title"],
+            authors=row["authors"],
+            abstract=row["abstract"],
+            published=row["publication_datetime_utc"],
+            accessed=row["accessed_datetime_utc"],
+            embedding=row["embedding"],
+        )
+
+
+def main(n: int, batch_size: int):
+    methods = {
+        "ORM (create per row)": ingest_orm,
+        "bulk_create (multi-row INSERT)": lambda repository, rows: repository.bulk_create(rows, method="insert"),
+        "bulk_create (binary COPY)": lambda repository, rows: repository.bulk_create(rows, method="copy"),
+    }
+    print(f"Ingesting {n} synthetic publications per method in batches of {batch_size}")
+    for i, (name, ingest) in enumerate(methods.items()):
+        # every method gets its own id range, so that no rows are skipped as duplicates
+        first_id = -1 - i * n
+        rows = synthetic_rows(n, first_id)
+        with Session() as session:
+            repository = PublicationRepository(session)
+            try:
+                start = time.perf_counter()
+                for j in range(0, n, batch_size):
+                    ingest(repository, rows[j : j + batch_size])
+                    repository.commit()
+                elapsed = time.perf_counter() - start
+                print(f"{name:<35} {elapsed:8.2f}s {n / elapsed:10,.0f} rows/s")
+            finally:
+                session.rollback()
+                id_range = (Publication.openalex_id <= first_id, Publication.openalex_id > first_id - n)
+                session.execute(delete(Publication).where(*id_range))
+                session.commit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark publication ingestion.")
+    parser.add_argument("--n", type=int, default=10000, help="Number of synthetic publications per method.")
+    parser.add_argument("--batch-size", type=int, default=2000, help="Number of publications per commit.")
+    args = parser.parse_args()
+    main(args.n, args.batch_size)
@@ -0,0 +1,89 @@
+"""
+Benchmark for date-filtered semantic search, sweeping the selectivity of the date window.
+
+For each selectivity, the embeddings of randomly sampled stored publications are used as queries. Reports latency,
+the number of returned results and recall@n (relative to exact search) for the previous approach (a WHERE clause next
+to the ANN index scan) and the DateFilterModes. Run from the repository root after building the ANN index, e.g.
+`python -m benchmarks.filtered_search --n 100 --queries 20`.
+"""
+
+import argparse
+import statistics
+import time
+
+from sqlalchemy import select, desc, text
+
+from core.repositories import DateFilterMode
+from core.repositories.publication_repository import PublicationRepository
+from core.repositories.vector_index import ef_search_for, vector_search_params
+from core.sqlalchemy_models import Publication
+from db import Session
+
+SELECTIVITIES = [0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0]
+
+
+def previous_search(repository: PublicationRepository, embedding, top_n: int, start_date) -> list[int]:
+    # the query used before date filter modes were introduced
+    query = (
+        select(Publication.openalex_id, (1 - Publication.embedding.cosine_distance(embedding)).label("similarity"))
+        .where(Publication.publication_datetime_utc >= start_date)
+        .order_by(desc("similarity"))
+        .limit(top_n)
+    )
+    with vector_search_params(repository.session, ef_search=ef_search_for(top_n)):
+        return [result.openalex_id for result in repository.session.execute(query).all()]
+
+
+def main(n: int, num_queries: int):
+    with Session() as session:
+        repository = PublicationRepository(session)
+        query_embeddings = [publication.embedding for publication in repository.get_random_publications(num_queries)]
+        print(f"Corpus size: {repository.count()}, n={n}, {len(query_embeddings)} queries per selectivity")
+
+        searches = {
+            "previous (WHERE + index scan)": lambda embedding, start_date: previous_search(
+                repository, embedding, n, start_date
+            ),
+        }
+
+        def filtered_search(embedding, start_date, mode: DateFilterMode) -> list[int]:
+            return repository.get_openalex_ids_by_embedding_similarity(
+                embedding, n, start_date, date_filter_mode=mode
+            )[0]
+
+        for mode in DateFilterMode:
+            searches[mode.value] = lambda embedding, start_date, mode=mode: filtered_search(embedding, start_date, mode)
+
+        print(f"{'selectivity':>11} {'method':<30} {'latency (ms)':>12} {'results':>8} {'recall@n':>9}")
+        for selectivity in SELECTIVITIES:
+            start_date = session.execute(
+                text(
+                    "SELECT percentile_disc(:fraction) WITHIN GROUP (ORDER BY publication_datetime_utc) "
+                    "FROM publication"
+                ),
+                {"fraction": 1 - selectivity},
+            ).scalar()
+            exact_results = [
+                set(filtered_search(embedding, start_date, DateFilterMode.EXACT)) for embedding in query_embeddings
+            ]
+            for name, search in searches.items():
+                latencies, result_counts, recalls = [], [], []
+                for embedding, exact in zip(query_embeddings, exact_results):
+                    start = time.perf_counter()
+                    ids = search(embedding, start_date)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    result_counts.append(len(ids))
+                    recalls.append(len(exact.intersection(ids)) / len(exact) if exact else 1.0)
+                print(
+                    f"{selectivity:>11.3f} {name:<30} {statistics.median(latencies):>12.1f} "
+                    f"{statistics.mean(result_counts):>8.1f} {statistics.mean(recalls):>9.3f}"
+                )
+            session.rollback()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark date-filtered semantic search.")
+    parser.add_argument("--n", type=int, default=100, help="Number of results per query.")
+    parser.add_argument("--queries", type=int, default=20, help="Number of queries per selectivity.")
+    args = parser.parse_args()
+    main(args.n, args.queries)
@@ -0,0 +1,100 @@
+"""
+Benchmark for the stages between retrieval and the final ranking, on the queries evaluated in
+notebooks/eval_reranking.ipynb.
+
+For every query work, the retrieved candidates are reranked by the LLM directly and after pruning them with MMR on
+their embeddings (MMRPruner). Reports the number of works, latency, LLM cost and recall (a result is relevant if the
+query work cites it, recall is relative to the relevant candidates) of each stage: recall@n of retrieval and of the
+reranked results, and the recall of the pruned pool. Candidate embeddings are read from the database and computed for
+candidates that are not stored. The retrieved candidates are replayed from the results, so retrieval latency is not
+measured, see get_relevant_works_for_query's stage logs for it. Run from the repository root, e.g.
+`python -m benchmarks.rerank_stages --n 10`.
+"""
+
+import argparse
+import statistics
+import time
+
+from benchmarks.reranking import MODEL, load_queries
+from core.llm_interfaces import OpenAIInterface
+from core.repositories.publication_repository import PublicationRepository
+from core.services.candidate_pruning import MMRPruner
+from core.services.openalex_client import OpenAlexClient
+from core.services.reranking_service import RerankingService
+from db import Session
+
+
+def recall(work_ids: list[int], relevant_ids: set[int]) -> float:
+    return len(relevant_ids.intersection(work_ids)) / len(relevant_ids) if relevant_ids else 1.0
+
+
+def main(path: str, n: int, diversity: float, max_pool_factor: float):
+    client = OpenAlexClient()
+    queries = load_queries(path, client)
+    client.close()
+
+    llm_interface = OpenAIInterface()
+    reranking_service = RerankingService(llm_interface, model=MODEL)
+    pruner = MMRPruner(diversity=diversity, max_pool_factor=max_pool_factor)
+    stages = {
+        name: {"works": [], "latency": [], "cost": [], "recall": []}
+        for name in ("retrieval", "rerank all", "pruning", "rerank pool")
+    }
+
+    def record(stage: str, works: list, latency: float, cost: float, relevant_ids: set[int]):
+        stages[stage]["works"].append(len(works))
+        stages[stage]["latency"].append(latency)
+        stages[stage]["cost"].append(cost)
+        stages[stage]["recall"].append(recall([work.id for work in works], relevant_ids))
+
+    with Session() as session:
+        repository = PublicationRepository(session)
+        for query_work, candidates, relevant_ids in queries:
+            relevant_ids = relevant_ids.intersection(work.id for work in candidates)
+            record("retrieval", candidates[:n], 0.0, 0.0, relevant_ids)
+
+            costs_before = llm_interface.accumulated_costs
+            start = time.perf_counter()
+            reranked = reranking_service.rerank(query_work.abstract, candidates, n)
+            latency = time.perf_counter() - start
+            record("rerank all", reranked, latency, llm_interface.accumulated_costs - costs_before, relevant_ids)
+
+            query_embedding = llm_interface.create_embedding(query_work.abstract)
+            embeddings = repository.get_embeddings_by_openalex_ids([work.id for work in candidates])
+            missing = [work for work in candidates if work.id not in embeddings]
+            if missing:
+                embeddings.update(
+                    zip(
+                        (work.id for work in missing),
+                        llm_interface.create_embedding_batch([work.abstract for work in missing]),
+                    )
+                )
+            start = time.perf_counter()
+            pool = [candidates[i] for i in pruner.prune(query_embedding, [embeddings[w.id] for w in candidates], n)]
+            record("pruning", pool, time.perf_counter() - start, 0.0, relevant_ids)
+
+            costs_before = llm_interface.accumulated_costs
+            start = time.perf_counter()
+            reranked = reranking_service.rerank(query_work.abstract, pool, n)
+            latency = time.perf_counter() - start
+            record("rerank pool", reranked, latency, llm_interface.accumulated_costs - costs_before, relevant_ids)
+
+    print(f"{len(queries)} queries, n={n}, diversity={diversity}, max_pool_factor={max_pool_factor}")
+    print(f"{'stage':<12} {'works':>6} {'latency (s)':>11} {'cost ($)':>9} {'recall':>7}")
+    for name, metrics in stages.items():
+        print(
+            f"{name:<12} {statistics.mean(metrics['works']):>6.1f} {statistics.mean(metrics['latency']):>11.2f} "
+            f"{statistics.mean(metrics['cost']):>9.4f} {statistics.mean(metrics['recall']):>7.2f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark recall and latency of the retrieval and reranking stages.")
+    parser.add_argument(
+        "--results", type=str, default="notebooks/eval_reranking_results.pkl", help="Evaluation results to rerank."
+    )
+    parser.add_argument("--n", type=int, default=10, help="Number of results.")
+    parser.add_argument("--diversity", type=float, default=0.2, help="Diversity weight of MMR.")
+    parser.add_argument("--max-pool-factor", type=float, default=5, help="Maximum pool size, as a multiple of n.")
+    args = parser.parse_args()
+    main(args.results, args.n, args.diversity, args.max_pool_factor)
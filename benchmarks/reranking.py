@@ -0,0 +1,110 @@
+"""
+Benchmark for LLM reranking on the queries evaluated in notebooks/eval_reranking.ipynb.
+
+For every query work in the evaluation results, the retrieved candidates are reranked with the previous approach
+(llmrankers' setwise heapsort, one sequential LLM call per comparison) and with RerankingService at several concurrency
+caps. Reports wall-clock time, speedup, LLM cost, precision@k (a result is relevant if the query work cites it) and the
+overlap of the top k with heapsort's. Run from the repository root, e.g.
+`python -m benchmarks.reranking --results notebooks/eval_reranking_results.pkl --k 10`.
+"""
+
+import argparse
+import statistics
+import time
+from os import environ
+
+import pandas as pd
+
+from core.dataclasses.data_classes import Work
+from core.llm_interfaces import OpenAIInterface
+from core.services.openalex_client import OpenAlexClient
+from core.services.reranking_service import RerankingService
+
+MODEL = "gpt-4o-mini-2024-07-18"
+
+
+def heapsort_rerank(query: str, works: list[Work], k: int) -> list[Work]:
+    # the reranking used before RerankingService
+    from llmrankers.rankers import SearchResult
+    from llmrankers.setwise import OpenAiSetwiseLlmRanker
+
+    reranker = OpenAiSetwiseLlmRanker(
+        model_name_or_path=MODEL, api_key=environ.get("OPENAI_API_KEY"), method="heapsort", num_child=2, k=k
+    )
+    works_by_id = {work.id: work for work in works}
+    docs = [SearchResult(docid=work.id, text=work.abstract, score=None) for work in works]
+    reranked_docs, _ = reranker.rerank(query, docs)
+    return [works_by_id[doc.docid] for doc in reranked_docs[:k]]
+
+
+def load_queries(path: str, client: OpenAlexClient) -> list[tuple[Work, list[Work], set[int]]]:
+    # returns the query work, its retrieved candidates in retrieval order and the ids of the relevant candidates
+    results = pd.read_pickle(path)
+    results = results[results["type"] == "retrieval"].sort_values(["run", "result_rank"])
+    queries = []
+    for query_work_id, rows in results.groupby("query_work", sort=False):
+        candidate_ids = [int(url.split("W")[-1]) for url in rows["result_work"]]
+        relevant_ids = {
+            int(url.split("W")[-1]) for url in rows[rows["is_reference_of_citing_work"]]["result_work"]
+        }
+        query_works, _ = client.get_works_by_ids([int(query_work_id.split("W")[-1])])
+        candidates, _ = client.get_works_by_ids(candidate_ids)
+        candidates = [work for work in candidates if work.abstract]
+        if query_works and query_works[0].abstract and candidates:
+            queries.append((query_works[0], candidates, relevant_ids))
+    return queries
+
+
+def main(path: str, k: int, concurrencies: list[int]):
+    client = OpenAlexClient()
+    queries = load_queries(path, client)
+    print(f"{len(queries)} queries, {statistics.mean(len(c) for _, c, _ in queries):.0f} candidates on average, k={k}")
+
+    llm_interface = OpenAIInterface()
+    methods = {"heapsort (previous)": lambda query, works: heapsort_rerank(query, works, k)}
+    for max_concurrency in concurrencies:
+        service = RerankingService(llm_interface, model=MODEL, max_concurrency=max_concurrency)
+        methods[f"tournament (concurrency {max_concurrency})"] = (
+            lambda query, works, service=service: service.rerank(query, works, k)
+        )
+
+    baseline_results = {}
+    baseline_latency = None
+    print(f"{'method':<30} {'latency (s)':>11} {'speedup':>8} {'cost ($)':>9} {'P@k':>6} {'overlap':>8}")
+    for name, rerank in methods.items():
+        latencies, precisions, overlaps = [], [], []
+        costs_before = llm_interface.accumulated_costs
+        for query_work, candidates, relevant_ids in queries:
+            start = time.perf_counter()
+            top_k = [work.id for work in rerank(query_work.abstract, candidates)]
+            latencies.append(time.perf_counter() - start)
+            precisions.append(len(relevant_ids.intersection(top_k)) / k)
+            if query_work.id in baseline_results:
+                overlaps.append(len(baseline_results[query_work.id].intersection(top_k)) / k)
+            else:
+                baseline_results[query_work.id] = set(top_k)
+        # the heapsort baseline calls the API directly, so its costs are not tracked by the interface
+        cost = llm_interface.accumulated_costs - costs_before
+        cost = f"{cost:>9.4f}" if baseline_latency is not None else f"{'-':>9}"
+        latency = statistics.mean(latencies)
+        if baseline_latency is None:
+            baseline_latency = latency
+        overlap = f"{statistics.mean(overlaps):>8.2f}" if overlaps else f"{'-':>8}"
+        print(
+            f"{name:<30} {latency:>11.1f} {baseline_latency / latency:>7.1f}x {cost} "
+            f"{statistics.mean(precisions):>6.2f} {overlap}"
+        )
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark LLM reranking latency and quality.")
+    parser.add_argument(
+        "--results", type=str, default="notebooks/eval_reranking_results.pkl", help="Evaluation results to rerank."
+    )
+    parser.add_argument("--k", type=int, default=10, help="Number of reranked results.")
+    parser.add_argument(
+        "--concurrency", type=int, nargs="+", default=[1, 4, 8], help="Concurrency caps of the tournament reranker."
+    )
+    args = parser.parse_args()
+    main(args.results, args.k, args.concurrency)
@@ -0,0 +1,77 @@
+"""
+Micro-benchmark for token counting of abstracts, as done when packing embedding batches.
+
+Compares the previous approach (looking up the encoding and encoding one string per call) with the cached encoding
+and the batch API, with and without memoization. Run from the repository root, e.g.
+`python -m benchmarks.tokenization --n 5000`.
+"""
+
+import argparse
+import random
+import time
+
+import tiktoken
+
+from core.llm_interfaces.tokenization import num_tokens_from_string, num_tokens_from_strings, token_count_cache
+
+ENCODING = "cl100k_base"
+
+
+def synthetic_abstracts(n: int, seed: int = 42) -> list[str]:
+    rng = random.Random(seed)
+    vocabulary = [
+        "retrieval", "augmented", "generation", "language", "model", "transformer", "embedding", "ranking", "query",
+        "document", "evaluation", "benchmark", "dataset", "neural", "sparse", "dense", "citation", "scholarly",
+        "summarization", "attention", "fine-tuning", "in-context", "learning", "the", "of", "and", "we", "propose",
+        "results", "show", "that", "a", "novel", "approach", "outperforms", "baselines", "on", "several", "tasks",
+    ]  # fmt: skip
+    # abstracts typically have 150-300 words
+    return [" ".join(rng.choices(vocabulary, k=rng.randint(150, 300))) + "." for _ in range(n)]
+
+
+def previous_num_tokens_from_string(string: str, encoding_name: str) -> int:
+    encoding = tiktoken.get_encoding(encoding_name)
+    return len(encoding.encode(string))
+
+
+def measure(name: str, func, abstracts: list[str]) -> list[int]:
+    start = time.perf_counter()
+    counts = func(abstracts)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<40} {elapsed:8.3f}s {len(abstracts) / elapsed:12,.0f} abstracts/s")
+    return counts
+
+
+def main(n: int, num_threads: int):
+    abstracts = synthetic_abstracts(n)
+    # load the encoding once up front, so that the first measurement does not include loading it
+    tiktoken.get_encoding(ENCODING)
+    print(f"Counting tokens of {n} synthetic abstracts ({num_threads} threads for batch encoding)")
+
+    reference = measure(
+        "per string, encoding looked up per call",
+        lambda texts: [previous_num_tokens_from_string(text, ENCODING) for text in texts],
+        abstracts,
+    )
+    results = [
+        measure(
+            "per string, cached encoding",
+            lambda texts: [num_tokens_from_string(text, ENCODING) for text in texts],
+            abstracts,
+        ),
+        measure("batch", lambda texts: num_tokens_from_strings(texts, ENCODING, num_threads), abstracts),
+    ]
+    token_count_cache.clear()
+    for name in ("batch, memoized (cold)", "batch, memoized (warm)"):
+        results.append(
+            measure(name, lambda texts: num_tokens_from_strings(texts, ENCODING, num_threads, memoize=True), abstracts)
+        )
+    assert all(counts == reference for counts in results), "token counts differ between approaches"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark token counting of abstracts.")
+    parser.add_argument("--n", type=int, default=5000, help="Number of synthetic abstracts.")
+    parser.add_argument("--threads", type=int, default=8, help="Number of threads for batch encoding.")
+    args = parser.parse_args()
+    main(args.n, args.threads)
@@ -1,15 +1,34 @@
-from core.llm_interfaces import LLMInterface, OpenAIInterface
+from core.llm_interfaces import (
+    LLMInterface,
+    OpenAIInterface,
+    AsyncLLMInterface,
+    AsyncOpenAIInterface,
+    CachedLLMInterface,
+    AsyncCachedLLMInterface,
+    EmbeddingCache,
+)
 from core.repositories import TopicRepository
 from core.repositories.publication_repository import PublicationRepository
 from core.services.publication_service import PublicationService
-from core.services.summarization_service import SummarizationService
+from core.services.reranking_service import RerankingService, JudgmentCache
+from core.services.summarization_service import SummarizationService, SummaryStore
 from db import Session
 
 session = Session()
-llm_interface: LLMInterface = OpenAIInterface()
+# embeddings are cached locally, so that the same text (e.g. a repeated query) is only embedded once
+embedding_cache = EmbeddingCache()
+llm_interface: LLMInterface = CachedLLMInterface(OpenAIInterface(), embedding_cache)
+async_llm_interface: AsyncLLMInterface = AsyncCachedLLMInterface(AsyncOpenAIInterface(), embedding_cache)
 publication_repository = PublicationRepository(session)
 topic_repository = TopicRepository(session)
-retrieval = PublicationService(publication_repository, topic_repository, llm_interface)
-summarization = SummarizationService(llm_interface)
+# reranking judgments are cached, so that reranking the same query over overlapping candidates reuses them
+reranking = RerankingService(llm_interface, judgment_cache=JudgmentCache(), async_llm_interface=async_llm_interface)
+retrieval = PublicationService(
+    publication_repository, topic_repository, llm_interface, async_llm_interface, reranking_service=reranking
+)
+# summaries are stored, so that repeated digests do not summarize the same work for the same query again
+summarization = SummarizationService(
+    llm_interface, async_llm_interface=async_llm_interface, summary_store=SummaryStore()
+)
 
 __all__ = ["retrieval", "summarization"]
@@ -1,7 +1,9 @@
 import datetime
+from collections.abc import Iterable, Iterator
 from functools import total_ordering
 from typing import Self
 
+import numpy as np
 import pyalex
 
 
@@ -36,6 +38,26 @@ class Work:
         )
         self.cited_by_count = pyalex_work["cited_by_count"]
 
+    @classmethod
+    def from_publication(cls, publication) -> Self:
+        """
+        Create a work from a stored publication (core.sqlalchemy_models.Publication) instead of an OpenAlex response.
+        The publication's OpenAlex metadata (topics, cited_by_count, created_datetime_utc) must have been stored.
+        """
+        if publication.topics is None:
+            raise ValueError(f"Publication {publication.openalex_id} has no stored OpenAlex metadata.")
+        work = cls.__new__(cls)
+        work.id = publication.openalex_id
+        work.title = publication.title
+        work.authors = list(publication.authors or [])
+        work.abstract = publication.abstract
+        # JSON object keys are strings, topic ids are integers
+        work.topics = {int(topic_id): topic for topic_id, topic in publication.topics.items()}
+        work.publication_date = publication.publication_datetime_utc
+        work.created_date = publication.created_datetime_utc
+        work.cited_by_count = publication.cited_by_count
+        return work
+
     def openalex_url(self) -> str:
         return f"https://openalex.org/W{self.id}"
 
@@ -82,3 +104,91 @@ class SummarizedWork:
 
     def __str__(self) -> str:
         return f"{self.work.title}\nSummary: {self.summary}"
+
+
+class QueryContext:
+    """
+    Per-request artifacts derived from a query (e.g. its embedding), computed at most once and shared by all retrieval
+    steps of the request. Contexts should not be reused across requests, as derived artifacts like the BM25 query
+    vector depend on the state of the corpus.
+    """
+
+    def __init__(self, query: str):
+        self.query: str = query
+        # whitespace-normalized query, used for embedding and BM25 retrieval
+        self.normalized_query: str = " ".join(query.split())
+        self.embedding: list[float] | None = None
+        self.bm25_query_vector: str | None = None
+
+    def __str__(self) -> str:
+        return self.normalized_query
+
+
+class CandidateSet:
+    """
+    The candidates of a retrieval request, shared by its stages (search, hydration, pruning, reranking, summarization)
+    instead of passing lists of works between them. Holds the ids of the candidates in rank order, score arrays aligned
+    with the ids (one per scoring stage, e.g. "retrieval") and a map from id to Work, filled by hydration.
+
+    Stages that narrow down or reorder the candidates create a new set via select, which shares the works of the
+    original set and reorders its scores by position, so that works are never looked up by scanning a list.
+    Iterating over a set or indexing it by position yields its works, so it can be passed wherever a sequence of works
+    is expected once it is hydrated.
+    """
+
+    def __init__(self, ids: Iterable[int], scores: dict[str, Iterable[float]] = None, works: dict[int, Work] = None):
+        """
+        Parameters:
+            ids: The ids of the candidates, in rank order.
+            scores: Scores of the candidates per stage, in the order of the ids.
+            works: Works by id, e.g. of the set the candidates were selected from.
+        """
+        self.ids: list[int] = list(ids)
+        self.scores: dict[str, np.ndarray] = {}
+        for stage, stage_scores in (scores or {}).items():
+            self.set_scores(stage, stage_scores)
+        self.works: dict[int, Work] = works if works is not None else {}
+
+    def set_scores(self, stage: str, scores: Iterable[float]):
+        scores = np.asarray(scores, dtype=np.float64)
+        if len(scores) != len(self.ids):
+            raise ValueError(f"Expected {len(self.ids)} {stage} scores, got {len(scores)}.")
+        self.scores[stage] = scores
+
+    def add_works(self, works: Iterable[Work]):
+        self.works.update((work.id, work) for work in works)
+
+    def select(self, ids: Iterable[int], scores: dict[str, Iterable[float]] = None) -> Self:
+        """
+        Create a set of the given candidates, in the given order. The scores of the candidates are carried over and
+        additional scores (e.g. of the selecting stage) can be passed.
+
+        Parameters:
+            ids: Ids of candidates of this set.
+            scores: Scores of the selected candidates per stage, in the order of the ids.
+        """
+        ids = list(ids)
+        position = {work_id: i for i, work_id in enumerate(self.ids)}
+        positions = np.fromiter((position[work_id] for work_id in ids), dtype=np.intp, count=len(ids))
+        selected = CandidateSet(ids, works=self.works)
+        selected.scores = {stage: stage_scores[positions] for stage, stage_scores in self.scores.items()}
+        for stage, stage_scores in (scores or {}).items():
+            selected.set_scores(stage, stage_scores)
+        return selected
+
+    def hydrated(self) -> Self:
+        """Returns the candidates whose works are available, in rank order."""
+        if all(work_id in self.works for work_id in self.ids):
+            return self
+        return self.select(work_id for work_id in self.ids if work_id in self.works)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, position: int | slice) -> Work | list[Work]:
+        if isinstance(position, slice):
+            return [self.works[work_id] for work_id in self.ids[position]]
+        return self.works[self.ids[position]]
+
+    def __iter__(self) -> Iterator[Work]:
+        return (self.works[work_id] for work_id in self.ids)
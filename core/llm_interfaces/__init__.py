@@ -1,2 +1,3 @@
-from .base import LLMInterface
-from .openai import OpenAIInterface
+from .base import LLMInterface, AsyncLLMInterface
+from .openai import OpenAIInterface, AsyncOpenAIInterface
+from .cached import CachedLLMInterface, AsyncCachedLLMInterface, EmbeddingCache
@@ -64,5 +64,56 @@ class LLMInterface:
     ) -> list[list[float]]:
         raise NotImplementedError
 
+    def create_embedding_batch_with_placeholders(
+        self, texts: list[str], config: dict = None
+    ) -> tuple[list[list[float]], set[str]]:
+        """
+        Like create_embedding_batch, but also returns the texts that were not embedded, but replaced with a
+        placeholder, e.g. because they exceed the token limit of the model. Their embeddings must not be reused.
+        """
+        return self.create_embedding_batch(texts, config), set()
+
     def handle_task(self, task: Task) -> str:
         raise NotImplementedError
+
+    def model_for_task(self, task: Task) -> str:
+        """Returns the model handle_task uses for the task."""
+        raise NotImplementedError
+
+    def create_completion(self, messages: list[Message], model: str) -> str:
+        raise NotImplementedError
+
+
+class AsyncLLMInterface:
+    """
+    Asynchronous counterpart of LLMInterface. Implementations are expected to be safe to use concurrently from a single
+    event loop, so that many requests can be multiplexed without holding one thread per in-flight call.
+    """
+
+    async def create_embedding(self, text: str, config: dict = None) -> list[float]:
+        raise NotImplementedError
+
+    async def create_embedding_batch(self, texts: list[str], config: dict = None) -> list[list[float]]:
+        raise NotImplementedError
+
+    async def create_embedding_batch_with_placeholders(
+        self, texts: list[str], config: dict = None
+    ) -> tuple[list[list[float]], set[str]]:
+        """
+        Like create_embedding_batch, but also returns the texts that were not embedded, but replaced with a
+        placeholder, e.g. because they exceed the token limit of the model. Their embeddings must not be reused.
+        """
+        return await self.create_embedding_batch(texts, config), set()
+
+    async def handle_task(self, task: Task) -> str:
+        raise NotImplementedError
+
+    def model_for_task(self, task: Task) -> str:
+        """Returns the model handle_task uses for the task."""
+        raise NotImplementedError
+
+    async def create_completion(self, messages: list[Message], model: str) -> str:
+        raise NotImplementedError
+
+    async def close(self):
+        pass
@@ -0,0 +1,207 @@
+import hashlib
+import threading
+from array import array
+from os import environ
+
+from utils.cache import LRUCache, SqliteStore
+from .base import LLMInterface, AsyncLLMInterface, Message, Task
+
+
+class EmbeddingCacheStats:
+    def __init__(self):
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @property
+    def hits(self) -> int:
+        return self.memory_hits + self.disk_hits
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"Hits: {self.hits} (memory: {self.memory_hits}, disk: {self.disk_hits}), Misses: {self.misses}, "
+            f"Hit rate: {self.hit_rate:.1%}"
+        )
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache. Embeddings are keyed by embedding model, dimensions and a hash of the text, and
+    stored in a local SQLite database with an in-memory LRU cache in front of it. The LRU cache holds single precision
+    arrays, which take about a quarter of the memory of lists of floats.
+    """
+
+    def __init__(self, path: str = None, memory_cache_size: int = 10_000):
+        """
+        Parameters:
+            path: Path of the SQLite database. Defaults to $EMBEDDING_CACHE_PATH or .cache/embeddings.sqlite3.
+            memory_cache_size: Maximum number of embeddings kept in memory.
+        """
+        if path is None:
+            path = environ.get("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite3")
+        self.store = SqliteStore(path, table="embedding")
+        self.memory_cache = LRUCache(memory_cache_size)
+        self.stats = EmbeddingCacheStats()
+        self._stats_lock = threading.Lock()
+
+    @staticmethod
+    def key(text: str, model: str, dimensions: int) -> str:
+        return f"{model}:{dimensions}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+    def get_many(self, keys: list[str]) -> dict[str, list[float]]:
+        embeddings = {}
+        for key in keys:
+            embedding = self.memory_cache.get(key)
+            if embedding is not None:
+                embeddings[key] = embedding.tolist()
+        memory_hits = len(embeddings)
+
+        not_in_memory = [key for key in keys if key not in embeddings]
+        for key, value in self.store.get_many(not_in_memory).items():
+            embedding = array("f", value)
+            self.memory_cache.put(key, embedding)
+            embeddings[key] = embedding.tolist()
+
+        with self._stats_lock:
+            self.stats.memory_hits += memory_hits
+            self.stats.disk_hits += len(embeddings) - memory_hits
+            self.stats.misses += len(keys) - len(embeddings)
+        return embeddings
+
+    def put_many(self, items: dict[str, list[float]]):
+        # embeddings are stored with single precision, like pgvector does
+        items = {key: array("f", embedding) for key, embedding in items.items()}
+        for key, embedding in items.items():
+            self.memory_cache.put(key, embedding)
+        self.store.put_many((key, embedding.tobytes()) for key, embedding in items.items())
+
+
+class _EmbeddingCacheMixin:
+    # Lookup logic shared by the synchronous and asynchronous caching wrappers.
+
+    def __init__(self, llm_interface, cache: EmbeddingCache = None):
+        self.llm_interface = llm_interface
+        self.cache = cache if cache is not None else EmbeddingCache()
+
+    @property
+    def stats(self) -> EmbeddingCacheStats:
+        return self.cache.stats
+
+    def _keys(self, texts: list[str], config: dict | None) -> list[str]:
+        # the key depends on the effective model and dimensions, i.e. the wrapped interface's defaults merged with config
+        config = {**getattr(self.llm_interface, "defaults", {}), **(config or {})}
+        return [
+            EmbeddingCache.key(text, config.get("embedding_model"), config.get("embedding_dimensions"))
+            for text in texts
+        ]
+
+    def _lookup(self, texts: list[str], config: dict | None) -> tuple[list[str], dict[str, list[float]], list[str]]:
+        # returns the keys of all texts, the cached embeddings and the distinct texts that still need to be embedded
+        keys = self._keys(texts, config)
+        cached = self.cache.get_many(list(dict.fromkeys(keys)))
+        missing_texts = list(dict.fromkeys(text for text, key in zip(texts, keys) if key not in cached))
+        return keys, cached, missing_texts
+
+    def _complete(
+        self,
+        keys: list[str],
+        cached: dict[str, list[float]],
+        missing_texts: list[str],
+        new_embeddings: list[list[float]],
+        placeholder_texts: set[str],
+        config: dict | None,
+    ) -> list[list[float]]:
+        new_items = dict(zip(self._keys(missing_texts, config), new_embeddings))
+        # placeholder embeddings are returned, but not cached, so that the texts are embedded again next time
+        placeholders = set(self._keys(list(placeholder_texts), config))
+        self.cache.put_many({key: embedding for key, embedding in new_items.items() if key not in placeholders})
+        cached.update(new_items)
+        return [cached[key] for key in keys]
+
+    def model_for_task(self, task: Task) -> str:
+        return self.llm_interface.model_for_task(task)
+
+    def __getattr__(self, name):
+        # expose attributes of the wrapped interface, e.g. accumulated_costs
+        if name == "llm_interface":
+            raise AttributeError(name)
+        return getattr(self.llm_interface, name)
+
+
+class CachedLLMInterface(_EmbeddingCacheMixin, LLMInterface):
+    """
+    Wraps an LLMInterface and caches its embeddings, so that the same text is only embedded once.
+    Batch requests only send the texts that are not cached to the wrapped interface. Other calls are passed through.
+    """
+
+    def __init__(self, llm_interface: LLMInterface, cache: EmbeddingCache = None):
+        """
+        Parameters:
+            llm_interface: The interface to wrap.
+            cache: The embedding cache to use. Can be shared with other wrappers, e.g. an AsyncCachedLLMInterface.
+        """
+        super().__init__(llm_interface, cache)
+
+    def create_embedding(self, text: str, config: dict = None) -> list[float]:
+        return self.create_embedding_batch([text], config)[0]
+
+    def create_embedding_batch(self, texts: list[str], config: dict = None) -> list[list[float]]:
+        return self.create_embedding_batch_with_placeholders(texts, config)[0]
+
+    def create_embedding_batch_with_placeholders(
+        self, texts: list[str], config: dict = None
+    ) -> tuple[list[list[float]], set[str]]:
+        keys, cached, missing_texts = self._lookup(texts, config)
+        new_embeddings, placeholder_texts = [], set()
+        if missing_texts:
+            # also a single text goes through the batch path, which replaces texts that are too long
+            new_embeddings, placeholder_texts = self.llm_interface.create_embedding_batch_with_placeholders(
+                missing_texts, config
+            )
+        return self._complete(keys, cached, missing_texts, new_embeddings, placeholder_texts, config), placeholder_texts
+
+    def handle_task(self, task: Task) -> str:
+        return self.llm_interface.handle_task(task)
+
+    def create_completion(self, messages: list[Message], model: str) -> str:
+        return self.llm_interface.create_completion(messages, model)
+
+
+class AsyncCachedLLMInterface(_EmbeddingCacheMixin, AsyncLLMInterface):
+    """
+    Asynchronous counterpart of CachedLLMInterface.
+    """
+
+    def __init__(self, llm_interface: AsyncLLMInterface, cache: EmbeddingCache = None):
+        super().__init__(llm_interface, cache)
+
+    async def create_embedding(self, text: str, config: dict = None) -> list[float]:
+        return (await self.create_embedding_batch([text], config))[0]
+
+    async def create_embedding_batch(self, texts: list[str], config: dict = None) -> list[list[float]]:
+        return (await self.create_embedding_batch_with_placeholders(texts, config))[0]
+
+    async def create_embedding_batch_with_placeholders(
+        self, texts: list[str], config: dict = None
+    ) -> tuple[list[list[float]], set[str]]:
+        keys, cached, missing_texts = self._lookup(texts, config)
+        new_embeddings, placeholder_texts = [], set()
+        if missing_texts:
+            new_embeddings, placeholder_texts = await self.llm_interface.create_embedding_batch_with_placeholders(
+                missing_texts, config
+            )
+        return self._complete(keys, cached, missing_texts, new_embeddings, placeholder_texts, config), placeholder_texts
+
+    async def handle_task(self, task: Task) -> str:
+        return await self.llm_interface.handle_task(task)
+
+    async def create_completion(self, messages: list[Message], model: str) -> str:
+        return await self.llm_interface.create_completion(messages, model)
+
+    async def close(self):
+        await self.llm_interface.close()
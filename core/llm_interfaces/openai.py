@@ -1,17 +1,41 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from os import environ
 
-import tiktoken
-from openai import OpenAI
+import httpx
+from openai import (
+    OpenAI,
+    AsyncOpenAI,
+    DefaultAsyncHttpxClient,
+    APIConnectionError,
+    APIStatusError,
+    InternalServerError,
+    RateLimitError,
+)
 from openai.types.chat import (
     ChatCompletionMessageParam,
     ChatCompletionSystemMessageParam,
     ChatCompletionUserMessageParam,
 )
 
-from .base import LLMInterface, LLMType, Message, Task
+from .base import LLMInterface, AsyncLLMInterface, LLMType, Message, Task
+from .rate_limiter import RateLimiter
+from .tokenization import num_tokens_from_string, num_tokens_from_strings
+
+logger = logging.getLogger(__name__)
+
+# errors after which a call is retried (after backing off); other errors, e.g. invalid requests, are raised immediately
+_retryable_errors = (RateLimitError, APIConnectionError, InternalServerError)
+
 
+class _OpenAIInterfaceBase:
+    """
+    Configuration, prompt conversion and cost accounting shared by the synchronous and asynchronous OpenAI interfaces.
+    """
 
-class OpenAIInterface(LLMInterface):
     defaults = {
         # https://platform.openai.com/docs/models/gpt-4-and-gpt-4-turbo
         # "quality_model": "gpt-4-0125-preview",
@@ -19,107 +43,132 @@ class OpenAIInterface(LLMInterface):
         "budget_model": "gpt-3.5-turbo-0125",
         "embedding_model": "text-embedding-3-large",
         "embedding_dimensions": 1024,
+        # number of token-packed embedding batches sent to the API in parallel
+        "embedding_batch_workers": 4,
     }
 
     model_to_cost_per_token = {
         # https://openai.com/pricing
         # "gpt-4-0125-preview": 10.00 / 1e6,
         "gpt-4o-2024-05-13": {"input": 5.00 / 1e6, "output": 15.00 / 1e6},
+        "gpt-4o-mini-2024-07-18": {"input": 0.15 / 1e6, "output": 0.60 / 1e6},
         "gpt-3.5-turbo-0125": {"input": 0.50 / 1e6, "output": 1.50 / 1e6},
         "text-embedding-3-large": 0.13 / 1e6,
     }
 
-    def __init__(self, print_usage_info: bool = False):
-        self.client = OpenAI(api_key=environ.get("OPENAI_API_KEY"))
-        # self.client = OpenAI(api_key=environ.get("OPENAI_API_KEY"), base_url="http://host.docker.internal:10080/v1")
-        self.accumulated_costs = 0.0
-        self.print_usage_info = print_usage_info
-
-    def handle_task(self, task: Task) -> str:
-        messages = task.get_prompt(LLMType.GPT)
-        model = self.defaults["quality_model"] if task.prioritize_quality else self.defaults["budget_model"]
-        completion = self.create_completion(messages=messages, model=model)
-
-        return completion
-
-    def create_embedding(self, text: str, config: dict = None) -> list[float]:
-        if config is None:
-            config = {}
-        # merge provided config with defaults
-        config = {**self.defaults, **config}
+    model_to_rate_limits = {
+        # Tier 1 limits, see https://platform.openai.com/account/limits and adjust to the tier of the account
+        "gpt-4o-2024-05-13": {"requests_per_minute": 500, "tokens_per_minute": 30_000},
+        "gpt-4o-mini-2024-07-18": {"requests_per_minute": 500, "tokens_per_minute": 200_000},
+        "gpt-3.5-turbo-0125": {"requests_per_minute": 3_500, "tokens_per_minute": 200_000},
+        "text-embedding-3-large": {"requests_per_minute": 3_000, "tokens_per_minute": 1_000_000},
+    }
 
-        response = self.client.embeddings.create(
-            input=[text],
-            model=config["embedding_model"],
-            dimensions=config["embedding_dimensions"],
-        )
+    # output tokens count towards the tokens-per-minute limit, but are unknown before the call
+    estimated_completion_tokens = 1024
 
-        used_tokens = response.usage.total_tokens
-        cost = used_tokens * self.model_to_cost_per_token[config["embedding_model"]]
-        self.accumulated_costs += cost
-        if self.print_usage_info:
-            print(
-                f"Model: {config['embedding_model']}, Tokens: {used_tokens}, Cost: ${cost:.2f}, Accumulated cost: ${self.accumulated_costs:.2f}"
-            )
+    # the embedding api currently accepts a maximum of 8191 tokens per call, so we need to batch the input
+    max_tokens_per_embedding_batch = 8191
 
-        return response.data[0].embedding
+    def __init__(self, print_usage_info: bool = False, rate_limiter: RateLimiter = None):
+        self.accumulated_costs = 0.0
+        self.print_usage_info = print_usage_info
+        # by default, all interfaces of the process share one rate limiter, as the limits apply per API key
+        self.rate_limiter = rate_limiter if rate_limiter is not None else shared_rate_limiter
+        # calls may be issued from multiple threads, so cost accounting must be synchronized
+        self._usage_lock = threading.Lock()
 
-    def create_embedding_batch(self, texts: list[str], config: dict = None) -> list[list[float]]:
+    def _merge_config(self, config: dict | None) -> dict:
         if config is None:
             config = {}
         # merge provided config with defaults
-        config = {**self.defaults, **config}
+        return {**self.defaults, **config}
+
+    def model_for_task(self, task: Task) -> str:
+        return self.defaults["quality_model"] if task.prioritize_quality else self.defaults["budget_model"]
 
-        # the embedding api currently accepts a maximum of 8191 tokens per call, so we need to batch the input
-        max_tokens_per_batch = 8191
+    def _pack_embedding_batches(self, texts: list[str], config: dict) -> tuple[list[list[str]], list[int], set[str]]:
+        # returns the batches together with their estimated number of tokens, and the texts replaced with a placeholder
         batches: list[list[str]] = []
+        placeholder_texts: set[str] = set()
+        batch_tokens: list[int] = []
         current_batch: list[str] = []
-        total_tokens = 0
         current_batch_tokens = 0
         tiktoken_encoding = (
             "cl100k_base"
             if config["embedding_model"] in ["text-embedding-3-large", "text-embedding-3-small"]
             else "cl100k_base"
         )
-        for text in texts:
-            num_tokens = num_tokens_from_string(text, tiktoken_encoding)
-            if num_tokens > max_tokens_per_batch:
+        for text, num_tokens in zip(texts, num_tokens_from_strings(texts, tiktoken_encoding)):
+            if num_tokens > self.max_tokens_per_embedding_batch:
                 # TODO: How to handle this case? For now, add ' ' to batch, '' fails
                 current_batch.append(" ")
+                placeholder_texts.add(text)
                 continue
 
-            if current_batch_tokens + num_tokens > max_tokens_per_batch:
+            if current_batch_tokens + num_tokens > self.max_tokens_per_embedding_batch:
                 batches.append(current_batch)
+                batch_tokens.append(current_batch_tokens)
                 current_batch = []
                 current_batch_tokens = 0
             current_batch.append(text)
             current_batch_tokens += num_tokens
-            total_tokens += num_tokens
 
         if current_batch:
             batches.append(current_batch)
+            batch_tokens.append(current_batch_tokens)
+
+        return batches, batch_tokens, placeholder_texts
+
+    def _estimate_completion_tokens(self, messages: list[Message]) -> int:
+        input_tokens = sum(num_tokens_from_string(message.content, "cl100k_base") for message in messages)
+        return input_tokens + self.estimated_completion_tokens
 
+    def _backoff(self, model: str, attempt: int, error: Exception) -> float:
+        headers = error.response.headers if isinstance(error, APIStatusError) else None
+        delay = self.rate_limiter.backoff(model, attempt, headers)
+        logger.warning(
+            f"OpenAI call for model {model} failed (attempt {attempt + 1}/{self.rate_limiter.max_retries + 1}): "
+            f"{error!r}. Retrying in {delay:.1f}s."
+        )
+        return delay
+
+    def _collect_embedding_batches(
+        self, results: list[tuple[list[list[float]], int]], config: dict
+    ) -> list[list[float]]:
+        # flattens per-batch results (embeddings, used tokens) and accounts the costs of all batches at once
         embeddings: list[list[float]] = []
         used_tokens = 0
-        for batch in batches:
-            response = self.client.embeddings.create(
-                input=batch,
-                model=config["embedding_model"],
-                dimensions=config["embedding_dimensions"],
-            )
-            embeddings.extend([embedding.embedding for embedding in response.data])
-            used_tokens += response.usage.total_tokens
+        for batch_embeddings, batch_tokens in results:
+            embeddings.extend(batch_embeddings)
+            used_tokens += batch_tokens
+        self._record_embedding_usage(config["embedding_model"], used_tokens)
+
+        return embeddings
+
+    def _record_embedding_usage(self, model: str, used_tokens: int):
+        cost = used_tokens * self.model_to_cost_per_token[model]
+        with self._usage_lock:
+            self.accumulated_costs += cost
+            accumulated_costs = self.accumulated_costs
+        if self.print_usage_info:
+            print(f"Model: {model}, Tokens: {used_tokens}, Cost: ${cost:.2f}, Accumulated cost: ${accumulated_costs:.2f}")
 
-        cost = used_tokens * self.model_to_cost_per_token[config["embedding_model"]]
-        self.accumulated_costs += cost
+    def _record_completion_usage(self, model: str, input_tokens: int, output_tokens: int):
+        cost = (input_tokens * self.model_to_cost_per_token[model]["input"]) + (
+            output_tokens * self.model_to_cost_per_token[model]["output"]
+        )
+        with self._usage_lock:
+            self.accumulated_costs += cost
+            accumulated_costs = self.accumulated_costs
         if self.print_usage_info:
             print(
-                f"Model: {config['embedding_model']}, Tokens: {used_tokens}, Cost: ${cost:.2f}, Accumulated cost: ${self.accumulated_costs:.2f}"
+                f"Model: {model}, Input Tokens: {input_tokens}, Output Tokens: {output_tokens},\
+                Cost: ${cost:.2f}, Accumulated cost: ${accumulated_costs:.2f}"
             )
 
-        return embeddings
-
-    def create_completion(self, messages: list[Message], model: str) -> str:
+    @staticmethod
+    def _to_completion_messages(messages: list[Message]) -> list[ChatCompletionMessageParam]:
         completion_messages: [ChatCompletionMessageParam] = []
         for message in messages:
             # Due to ChatCompletionMessageParam being a union, we need to check the role and instantiate the correct type
@@ -130,28 +179,216 @@ class OpenAIInterface(LLMInterface):
             else:
                 raise ValueError(f"Unsupported message role: {message.role}")
             completion_messages.append(message_param)
+        return completion_messages
 
-        response = self.client.chat.completions.create(messages=completion_messages, model=model)
 
-        input_tokens = response.usage.prompt_tokens
-        output_tokens = response.usage.completion_tokens
-        cost = (input_tokens * self.model_to_cost_per_token[model]["input"]) + (
-            output_tokens * self.model_to_cost_per_token[model]["output"]
+class OpenAIInterface(_OpenAIInterfaceBase, LLMInterface):
+    def __init__(self, print_usage_info: bool = False, rate_limiter: RateLimiter = None):
+        super().__init__(print_usage_info=print_usage_info, rate_limiter=rate_limiter)
+        # retries are handled by _request, which coordinates them with the rate limiter
+        self.client = OpenAI(api_key=environ.get("OPENAI_API_KEY"), max_retries=0)
+        # self.client = OpenAI(api_key=environ.get("OPENAI_API_KEY"), base_url="http://host.docker.internal:10080/v1")
+
+    def handle_task(self, task: Task) -> str:
+        messages = task.get_prompt(LLMType.GPT)
+        completion = self.create_completion(messages=messages, model=self.model_for_task(task))
+
+        return completion
+
+    def create_embedding(self, text: str, config: dict = None) -> list[float]:
+        config = self._merge_config(config)
+
+        response = self._request(
+            self.client.embeddings.with_raw_response.create,
+            model=config["embedding_model"],
+            estimated_tokens=num_tokens_from_string(text, "cl100k_base"),
+            input=[text],
+            dimensions=config["embedding_dimensions"],
         )
-        self.accumulated_costs += cost
-        if self.print_usage_info:
-            print(
-                f"Model: {model}, Input Tokens: {input_tokens}, Output Tokens: {output_tokens},\
-                Cost: ${cost:.2f}, Accumulated cost: ${self.accumulated_costs:.2f}"
+        self._record_embedding_usage(config["embedding_model"], response.usage.total_tokens)
+
+        return response.data[0].embedding
+
+    def create_embedding_batch(self, texts: list[str], config: dict = None) -> list[list[float]]:
+        return self.create_embedding_batch_with_placeholders(texts, config)[0]
+
+    def create_embedding_batch_with_placeholders(
+        self, texts: list[str], config: dict = None
+    ) -> tuple[list[list[float]], set[str]]:
+        config = self._merge_config(config)
+        batches, batch_tokens, placeholder_texts = self._pack_embedding_batches(texts, config)
+
+        def embed_batch(batch: list[str], estimated_tokens: int) -> tuple[list[list[float]], int]:
+            response = self._request(
+                self.client.embeddings.with_raw_response.create,
+                model=config["embedding_model"],
+                estimated_tokens=estimated_tokens,
+                input=batch,
+                dimensions=config["embedding_dimensions"],
             )
+            return [embedding.embedding for embedding in response.data], response.usage.total_tokens
+
+        num_workers = max(1, min(config["embedding_batch_workers"], len(batches)))
+        if num_workers == 1:
+            results = [embed_batch(batch, tokens) for batch, tokens in zip(batches, batch_tokens)]
+        else:
+            with ThreadPoolExecutor(max_workers=num_workers) as executor:
+                # executor.map returns the results in batch order, so the embeddings line up with the input texts
+                results = list(executor.map(embed_batch, batches, batch_tokens))
+
+        return self._collect_embedding_batches(results, config), placeholder_texts
+
+    def create_completion(self, messages: list[Message], model: str) -> str:
+        response = self._request(
+            self.client.chat.completions.with_raw_response.create,
+            model=model,
+            estimated_tokens=self._estimate_completion_tokens(messages),
+            messages=self._to_completion_messages(messages),
+        )
+        self._record_completion_usage(model, response.usage.prompt_tokens, response.usage.completion_tokens)
+
+        return response.choices[0].message.content.strip()
+
+    def _request(self, create, model: str, estimated_tokens: int, **kwargs):
+        # Issues a raw-response API call within the rate limiter's budget and retries retryable errors with backoff.
+        for attempt in range(self.rate_limiter.max_retries + 1):
+            wait = self.rate_limiter.reserve(model, estimated_tokens)
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                raw_response = create(model=model, **kwargs)
+            except _retryable_errors as e:
+                self.rate_limiter.settle(model, estimated_tokens, 0)
+                if attempt == self.rate_limiter.max_retries:
+                    raise
+                # the backoff pauses the model in the rate limiter, so the next reservation waits for it
+                self._backoff(model, attempt, e)
+                continue
+            except BaseException:
+                # non-retryable errors (and cancellations) must release the reservation as well
+                self.rate_limiter.settle(model, estimated_tokens, 0)
+                raise
+            self.rate_limiter.update_from_headers(model, raw_response.headers)
+            response = raw_response.parse()
+            self.rate_limiter.settle(model, estimated_tokens, response.usage.total_tokens)
+            return response
+
+
+class AsyncOpenAIInterface(_OpenAIInterfaceBase, AsyncLLMInterface):
+    """
+    Asynchronous OpenAI interface. All requests share a single pooled HTTP client, so one event loop can multiplex many
+    concurrent calls over a bounded number of connections. The interface should be used from one long-running event
+    loop and closed via close() (or `async with`) when no longer needed.
+    """
+
+    def __init__(
+        self,
+        print_usage_info: bool = False,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        rate_limiter: RateLimiter = None,
+    ):
+        """
+        Parameters:
+            print_usage_info: Print token usage and costs after every call.
+            max_connections: Maximum number of concurrent connections in the shared connection pool.
+            max_keepalive_connections: Maximum number of idle connections kept alive for reuse.
+            rate_limiter: Rate limiter to budget calls with. Defaults to the limiter shared by all interfaces.
+        """
+        super().__init__(print_usage_info=print_usage_info, rate_limiter=rate_limiter)
+        http_client = DefaultAsyncHttpxClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections)
+        )
+        # retries are handled by _request, which coordinates them with the rate limiter
+        self.client = AsyncOpenAI(api_key=environ.get("OPENAI_API_KEY"), http_client=http_client, max_retries=0)
+
+    async def handle_task(self, task: Task) -> str:
+        messages = task.get_prompt(LLMType.GPT)
+        return await self.create_completion(messages=messages, model=self.model_for_task(task))
+
+    async def create_embedding(self, text: str, config: dict = None) -> list[float]:
+        config = self._merge_config(config)
+
+        response = await self._request(
+            self.client.embeddings.with_raw_response.create,
+            model=config["embedding_model"],
+            estimated_tokens=num_tokens_from_string(text, "cl100k_base"),
+            input=[text],
+            dimensions=config["embedding_dimensions"],
+        )
+        self._record_embedding_usage(config["embedding_model"], response.usage.total_tokens)
+
+        return response.data[0].embedding
+
+    async def create_embedding_batch(self, texts: list[str], config: dict = None) -> list[list[float]]:
+        return (await self.create_embedding_batch_with_placeholders(texts, config))[0]
+
+    async def create_embedding_batch_with_placeholders(
+        self, texts: list[str], config: dict = None
+    ) -> tuple[list[list[float]], set[str]]:
+        config = self._merge_config(config)
+        batches, batch_tokens, placeholder_texts = self._pack_embedding_batches(texts, config)
+
+        semaphore = asyncio.Semaphore(max(1, config["embedding_batch_workers"]))
+
+        async def embed_batch(batch: list[str], estimated_tokens: int) -> tuple[list[list[float]], int]:
+            async with semaphore:
+                response = await self._request(
+                    self.client.embeddings.with_raw_response.create,
+                    model=config["embedding_model"],
+                    estimated_tokens=estimated_tokens,
+                    input=batch,
+                    dimensions=config["embedding_dimensions"],
+                )
+            return [embedding.embedding for embedding in response.data], response.usage.total_tokens
+
+        # gather returns the results in batch order, so the embeddings line up with the input texts
+        results = await asyncio.gather(*(embed_batch(batch, tokens) for batch, tokens in zip(batches, batch_tokens)))
+
+        return self._collect_embedding_batches(results, config), placeholder_texts
+
+    async def create_completion(self, messages: list[Message], model: str) -> str:
+        response = await self._request(
+            self.client.chat.completions.with_raw_response.create,
+            model=model,
+            estimated_tokens=self._estimate_completion_tokens(messages),
+            messages=self._to_completion_messages(messages),
+        )
+        self._record_completion_usage(model, response.usage.prompt_tokens, response.usage.completion_tokens)
 
         return response.choices[0].message.content.strip()
 
+    async def _request(self, create, model: str, estimated_tokens: int, **kwargs):
+        # Async counterpart of OpenAIInterface._request.
+        for attempt in range(self.rate_limiter.max_retries + 1):
+            wait = self.rate_limiter.reserve(model, estimated_tokens)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                raw_response = await create(model=model, **kwargs)
+            except _retryable_errors as e:
+                self.rate_limiter.settle(model, estimated_tokens, 0)
+                if attempt == self.rate_limiter.max_retries:
+                    raise
+                self._backoff(model, attempt, e)
+                continue
+            except BaseException:
+                self.rate_limiter.settle(model, estimated_tokens, 0)
+                raise
+            self.rate_limiter.update_from_headers(model, raw_response.headers)
+            response = raw_response.parse()
+            self.rate_limiter.settle(model, estimated_tokens, response.usage.total_tokens)
+            return response
+
+    async def close(self):
+        await self.client.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+shared_rate_limiter = RateLimiter(_OpenAIInterfaceBase.model_to_rate_limits)
 
-# function to calculate the number of tokens in a string
-# taken from https://platform.openai.com/docs/guides/embeddings/how-can-i-tell-how-many-tokens-a-string-has-before-i-embed-it
-def num_tokens_from_string(string: str, encoding_name: str) -> int:
-    """Returns the number of tokens in a text string."""
-    encoding = tiktoken.get_encoding(encoding_name)
-    num_tokens = len(encoding.encode(string))
-    return num_tokens
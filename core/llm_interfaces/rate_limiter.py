@@ -0,0 +1,181 @@
+import random
+import re
+import threading
+import time
+from collections.abc import Mapping
+
+
+class _Bucket:
+    """
+    Token bucket that refills continuously at `limit` units per minute. Reservations may drive the balance negative,
+    in which case the caller has to wait until the bucket has refilled; this queues concurrent callers fairly instead of
+    letting them race for the same budget.
+    """
+
+    def __init__(self, limit_per_minute: int):
+        self.capacity = float(limit_per_minute)
+        self.refill_per_second = limit_per_minute / 60.0
+        self.balance = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.balance = min(self.capacity, self.balance + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        self.refill(now)
+        # a single request can never need more than the full bucket
+        self.balance -= min(amount, self.capacity)
+        if self.balance >= 0:
+            return 0.0
+        return -self.balance / self.refill_per_second
+
+
+class RateLimiter:
+    """
+    Client-side requests-per-minute and tokens-per-minute budgeting per model.
+
+    Callers reserve the estimated number of tokens before a call (reserve), correct the estimate once the actual usage
+    is known (settle), and report the rate limit headers of responses (update_from_headers), so that the local budget
+    tracks the one enforced by the server. A single instance is meant to be shared by all interfaces of a process.
+    """
+
+    def __init__(
+        self,
+        model_limits: Mapping[str, Mapping[str, int]],
+        max_retries: int = 6,
+        initial_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+    ):
+        """
+        Parameters:
+            model_limits: Mapping of model name to {"requests_per_minute": int, "tokens_per_minute": int}.
+                Models without limits are not budgeted, but still retried.
+            max_retries: Maximum number of retries of a failed call.
+            initial_backoff: Backoff in seconds after the first failure, doubled after every further failure.
+            max_backoff: Upper bound of the backoff in seconds.
+        """
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self._request_buckets = {
+            model: _Bucket(limits["requests_per_minute"]) for model, limits in model_limits.items()
+        }
+        self._token_buckets = {model: _Bucket(limits["tokens_per_minute"]) for model, limits in model_limits.items()}
+        # point in time (time.monotonic) until which no calls should be issued for a model, set after a 429
+        self._paused_until: dict[str, float] = {}
+
+    def reserve(self, model: str, tokens: int) -> float:
+        """
+        Reserve one request and the given number of tokens for the model.
+
+        Returns:
+            float: The number of seconds the caller has to wait before issuing the call.
+        """
+        with self._lock:
+            now = time.monotonic()
+            wait = self._paused_until.get(model, now) - now
+            if model in self._request_buckets:
+                wait = max(
+                    wait,
+                    self._request_buckets[model].reserve(1, now),
+                    self._token_buckets[model].reserve(tokens, now),
+                )
+            return max(0.0, wait)
+
+    def settle(self, model: str, reserved_tokens: int, used_tokens: int):
+        """Return over-reserved tokens to the budget, or charge the difference if the estimate was too low."""
+        with self._lock:
+            if model in self._token_buckets:
+                bucket = self._token_buckets[model]
+                bucket.balance = min(bucket.capacity, bucket.balance + reserved_tokens - used_tokens)
+
+    def update_from_headers(self, model: str, headers: Mapping[str, str]):
+        """Align the local budget with the remaining budget reported by the server."""
+        remaining_requests = _parse_int(headers.get("x-ratelimit-remaining-requests"))
+        remaining_tokens = _parse_int(headers.get("x-ratelimit-remaining-tokens"))
+        with self._lock:
+            if model not in self._request_buckets:
+                return
+            now = time.monotonic()
+            for bucket, remaining in (
+                (self._request_buckets[model], remaining_requests),
+                (self._token_buckets[model], remaining_tokens),
+            ):
+                if remaining is not None:
+                    bucket.refill(now)
+                    # other clients using the same API key may have consumed part of the budget
+                    bucket.balance = min(bucket.balance, float(remaining))
+
+    def backoff(self, model: str, attempt: int, headers: Mapping[str, str] = None) -> float:
+        """
+        Compute the delay before retrying a failed call and pause all calls for the model for that duration.
+        The delay is derived from the server's retry-after/reset headers if present, otherwise from exponential
+        backoff; both are jittered so that concurrent callers don't retry in lockstep.
+
+        Parameters:
+            model: The model of the failed call.
+            attempt: Number of the failed attempt, starting at 0.
+            headers: Headers of the error response, if any.
+
+        Returns:
+            float: The number of seconds to wait before retrying.
+        """
+        exponential = min(self.max_backoff, self.initial_backoff * 2**attempt)
+        server_hint = _retry_after_from_headers(headers) if headers is not None else None
+        if server_hint is not None:
+            delay = min(self.max_backoff, server_hint) + random.uniform(0, self.initial_backoff)
+        else:
+            # "full jitter", see https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/
+            delay = random.uniform(exponential / 2, exponential)
+        with self._lock:
+            now = time.monotonic()
+            self._paused_until[model] = max(self._paused_until.get(model, now), now + delay)
+        return delay
+
+
+def _parse_int(value: str | None) -> int | None:
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+# OpenAI reports reset times as durations like "1s", "6m0s" or "20ms"
+_duration_pattern = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_duration_unit_seconds = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def _parse_duration(value: str | None) -> float | None:
+    if not value:
+        return None
+    parts = _duration_pattern.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _duration_unit_seconds[unit] for amount, unit in parts)
+
+
+def _retry_after_from_headers(headers: Mapping[str, str]) -> float | None:
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms is not None:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if retry_after is not None:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    resets = [
+        _parse_duration(headers.get("x-ratelimit-reset-requests"))
+        if _parse_int(headers.get("x-ratelimit-remaining-requests")) == 0
+        else None,
+        _parse_duration(headers.get("x-ratelimit-reset-tokens"))
+        if _parse_int(headers.get("x-ratelimit-remaining-tokens")) == 0
+        else None,
+    ]
+    resets = [reset for reset in resets if reset is not None]
+    return max(resets) if resets else None
@@ -1,3 +1,6 @@
+import hashlib
+import json
+import re
 import string
 import textwrap
 
@@ -146,6 +149,20 @@ class CustomizedSummaryTask(Task):
         self.area_of_research = area_of_research
         self.abstract = abstract
 
+    @classmethod
+    def template_version(cls) -> str:
+        """
+        Returns a hash of the prompt templates, which changes whenever the templates change. Used to invalidate stored
+        summaries generated with other templates.
+        """
+        templates = [
+            cls.self_discover_prompt_templates.template,
+            cls.task_template.template,
+            cls.reasoning_structure,
+            *(message.content for message in cls.prompt_templates[LLMType.GPT].values()),
+        ]
+        return hashlib.sha256(json.dumps(templates).encode("utf-8")).hexdigest()[:16]
+
     def get_prompt(self, llm_type: LLMType) -> [Message]:
         """
         Generate the prompt for the specified LLMType.
@@ -164,3 +181,74 @@ class CustomizedSummaryTask(Task):
         prompt = self.self_discover_prompt_templates.substitute(reasoning_structure=self.reasoning_structure, task=task)
         user_message = Message("user", prompt)
         return [system_message, user_message]
+
+
+class SelectRelevantPassagesTask(Task):
+    """
+    Setwise relevance judgment: select the passages most relevant to a query from a small, labeled set of passages.
+    Used by the tournament reranker, see RerankingService.
+    """
+
+    prompt_templates = {
+        LLMType.GPT: {
+            "system": Message(
+                "system",
+                "You are RankGPT, an intelligent assistant that can rank passages based on their relevancy to the "
+                "query.",
+            ),
+            "user": Message(
+                "user",
+                'Given a query "{query}", which {num_selected} of the following passages are the most relevant to '
+                "the query?\n\n{passages}\n\nOutput only the labels of the {num_selected} most relevant passages, "
+                "most relevant first, separated by commas, e.g. {example}.",
+            ),
+        }
+    }
+
+    def __init__(self, query: str, passages: list[str], num_selected: int, prioritize_quality: bool = False):
+        """
+        Parameters:
+            query: The query to judge relevance for.
+            passages: The passages to select from. They are labeled [1], [2], ... in the prompt.
+            num_selected: Number of passages to select.
+        """
+        super().__init__(prioritize_quality=prioritize_quality)
+        if not 1 <= num_selected <= len(passages):
+            raise ValueError("num_selected must be between 1 and the number of passages.")
+
+        self.query = query
+        self.passages = passages
+        self.num_selected = num_selected
+
+    def get_prompt(self, llm_type: LLMType) -> [Message]:
+        """
+        Generate the prompt for the specified LLMType.
+
+        Parameters:
+            llm_type (LLMType): The LLM type to specify which template to use.
+
+        Returns:
+            list[Message]: The messages representing the prompt for the specified LLM type.
+        """
+        template = self.prompt_templates[llm_type]
+        passages = "\n\n".join(f"Passage [{i + 1}]: {passage}" for i, passage in enumerate(self.passages))
+        example = ", ".join(f"[{i + 1}]" for i in range(self.num_selected))
+        user_message = template["user"].format(
+            query=self.query, num_selected=self.num_selected, passages=passages, example=example
+        )
+        return [template["system"], user_message]
+
+    def parse_response(self, response: str) -> list[int]:
+        """
+        Parse the labels of the selected passages from a response.
+
+        Returns:
+            list[int]: Indices (0-based) of the selected passages, most relevant first. Invalid and repeated labels are
+                ignored, so fewer than num_selected indices may be returned.
+        """
+        indices = []
+        for label in re.findall(r"\d+", response):
+            index = int(label) - 1
+            if 0 <= index < len(self.passages) and index not in indices:
+                indices.append(index)
+        return indices[: self.num_selected]
@@ -0,0 +1,87 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import cache
+
+import tiktoken
+
+
+@cache
+def get_encoding(encoding_name: str) -> tiktoken.Encoding:
+    """Returns the tiktoken encoding with the given name. Each encoding is loaded once per process."""
+    return tiktoken.get_encoding(encoding_name)
+
+
+class TokenCountCache:
+    """
+    Thread-safe LRU cache of token counts, keyed by encoding and a hash of the text, so that the texts themselves
+    don't have to be kept in memory.
+    """
+
+    def __init__(self, max_size: int = 1_000_000):
+        self.max_size = max_size
+        self._counts: OrderedDict[tuple[str, bytes], int] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(text: str, encoding_name: str) -> tuple[str, bytes]:
+        return encoding_name, hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    def get(self, key: tuple[str, bytes]) -> int | None:
+        with self._lock:
+            count = self._counts.get(key)
+            if count is not None:
+                self._counts.move_to_end(key)
+            return count
+
+    def put(self, key: tuple[str, bytes], count: int):
+        with self._lock:
+            self._counts[key] = count
+            self._counts.move_to_end(key)
+            while len(self._counts) > self.max_size:
+                self._counts.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+
+
+token_count_cache = TokenCountCache()
+
+
+# function to calculate the number of tokens in a string
+# taken from https://platform.openai.com/docs/guides/embeddings/how-can-i-tell-how-many-tokens-a-string-has-before-i-embed-it
+def num_tokens_from_string(string: str, encoding_name: str) -> int:
+    """Returns the number of tokens in a text string."""
+    # encode_ordinary treats special tokens like <|endoftext|> as plain text (as the API does) instead of raising
+    return len(get_encoding(encoding_name).encode_ordinary(string))
+
+
+def num_tokens_from_strings(
+    strings: list[str], encoding_name: str, num_threads: int = 8, memoize: bool = False
+) -> list[int]:
+    """
+    Returns the number of tokens of each text string, using tiktoken's batch encoding on a thread pool.
+
+    Parameters:
+        strings: The texts to count the tokens of.
+        encoding_name: Name of the tiktoken encoding, e.g. "cl100k_base".
+        num_threads: Number of threads used for encoding.
+        memoize: Look up and store the counts in the process-wide token_count_cache, keyed by a hash of the text.
+
+    Returns:
+        list[int]: The token counts, in the order of the input strings.
+    """
+    encoding = get_encoding(encoding_name)
+    if not memoize:
+        return [len(tokens) for tokens in encoding.encode_ordinary_batch(strings, num_threads=num_threads)]
+
+    keys = [TokenCountCache.key(string, encoding_name) for string in strings]
+    counts = [token_count_cache.get(key) for key in keys]
+    missing = [i for i, count in enumerate(counts) if count is None]
+    if missing:
+        encoded = encoding.encode_ordinary_batch([strings[i] for i in missing], num_threads=num_threads)
+        for i, tokens in zip(missing, encoded):
+            counts[i] = len(tokens)
+            token_count_cache.put(keys[i], counts[i])
+    return counts
@@ -1,2 +1,5 @@
-from .publication_repository import PublicationRepository
+from .harvest_checkpoint_repository import HarvestCheckpointRepository
+from .publication_repository import PublicationRepository, ScoreFusion
+from .sync_state_repository import SyncStateRepository
 from .topic_repository import TopicRepository
+from .vector_index import VectorIndexType, DateFilterMode
@@ -0,0 +1,36 @@
+from datetime import date, datetime, timezone
+
+from core.sqlalchemy_models import HarvestCheckpoint
+from db import Session
+
+
+class HarvestCheckpointRepository:
+    def __init__(self, session: Session):
+        self.session = session
+
+    def commit(self):
+        self.session.commit()
+
+    def get(self, key: str) -> HarvestCheckpoint | None:
+        return self.session.get(HarvestCheckpoint, key)
+
+    def save(
+        self, key: str, next_cursor: str, to_publication_date: date, works_harvested: int, last_work_id: int | None
+    ) -> HarvestCheckpoint:
+        """Create or update the checkpoint of a harvest. Does not commit."""
+        checkpoint = self.session.get(HarvestCheckpoint, key)
+        if checkpoint is None:
+            checkpoint = HarvestCheckpoint(key=key)
+            self.session.add(checkpoint)
+        checkpoint.next_cursor = next_cursor
+        checkpoint.to_publication_date = to_publication_date
+        checkpoint.works_harvested = works_harvested
+        checkpoint.last_work_id = last_work_id
+        checkpoint.updated_datetime_utc = datetime.now(timezone.utc)
+        return checkpoint
+
+    def delete(self, key: str):
+        """Delete the checkpoint of a harvest, if it exists. Does not commit."""
+        checkpoint = self.session.get(HarvestCheckpoint, key)
+        if checkpoint is not None:
+            self.session.delete(checkpoint)
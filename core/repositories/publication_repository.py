@@ -1,14 +1,88 @@
-from datetime import datetime
+import logging
+import weakref
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Literal
 
-from sqlalchemy import select, desc, text, func
+import numpy as np
+from pgvector.psycopg import register_vector
+from pgvector.sqlalchemy import Vector
+from psycopg.types.json import Jsonb
+from sqlalchemy import select, desc, text, func, literal_column, bindparam, TextClause
+from sqlalchemy.dialects.postgresql import insert, JSONB
+from sqlalchemy.orm import defer
 
-from core.sqlalchemy_models import Publication
+from core.sqlalchemy_models import Publication, Bm25Statistics
 from db import Session
+from utils.cache import LRUCache
+from .vector_index import (
+    VectorIndexType,
+    DateFilterMode,
+    ef_search_for,
+    vector_search_params,
+    build_vector_index,
+    drop_vector_index,
+)
+
+logger = logging.getLogger(__name__)
+
+# psycopg connections on which the pgvector types have already been registered (needed for binary COPY)
+_vector_registered_connections = weakref.WeakSet()
+
+# on upsert, the BM25 vector of a publication is reset if its abstract changed, so that it gets recomputed
+_upsert_bm25_sql = (
+    "CASE WHEN publication.abstract IS DISTINCT FROM excluded.abstract THEN NULL ELSE publication.bm25 END"
+)
+
+
+class ScoreFusion(Enum):
+    """
+    How hybrid search merges the semantic and the BM25 ranking.
+    LINEAR: Weighted sum of the (min-max normalized) scores.
+    RRF: Weighted reciprocal rank fusion, the sum of weight / (rrf_k + rank). Independent of the score distributions.
+    """
+
+    LINEAR = "linear"
+    RRF = "rrf"
 
 
 class PublicationRepository:
+    # columns written by bulk_create/bulk_upsert, rows are dicts keyed by these column names
+    bulk_columns = [
+        "openalex_id",
+        "title",
+        "authors",
+        "abstract",
+        "publication_datetime_utc",
+        "accessed_datetime_utc",
+        "embedding",
+        "topics",
+        "cited_by_count",
+        "created_datetime_utc",
+    ]
+    # PostgreSQL types of bulk_columns, used for binary COPY
+    _bulk_column_types = [
+        "bigint",
+        "varchar",
+        "varchar[]",
+        "varchar",
+        "timestamptz",
+        "timestamptz",
+        "vector",
+        "jsonb",
+        "integer",
+        "timestamptz",
+    ]
+    # relative corpus drift after which update_bm25 recomputes all BM25 vectors
+    bm25_drift_threshold = 0.2
+    # seconds for which date selectivity estimates are reused, the planner statistics only change with ANALYZE
+    date_selectivity_ttl = 60 * 60
+
     def __init__(self, session: Session):
         self.session = session
+        self._iterative_scan_supported: bool | None = None
+        # estimate_date_selectivity by start date, saves two round trips per filtered search in DateFilterMode.AUTO
+        self._date_selectivities = LRUCache(1024, ttl=self.date_selectivity_ttl)
 
     def commit(self):
         self.session.commit()
@@ -35,71 +109,604 @@ class PublicationRepository:
         self.session.add(publication)
         return publication
 
+    def bulk_create(self, rows: list[dict], method: Literal["copy", "insert"] = "copy") -> int:
+        """
+        Insert many publications at once, skipping publications whose openalex_id already exists.
+        Does not commit.
+
+        Parameters:
+            rows: Dicts with the keys in bulk_columns. Missing optional metadata (topics, cited_by_count,
+                created_datetime_utc) is stored as NULL.
+            method: "copy" streams the rows into a staging table via binary COPY and inserts them from there,
+                "insert" uses multi-row INSERT statements.
+
+        Returns:
+            int: The number of inserted publications.
+        """
+        return self._bulk_write(rows, method, on_conflict="nothing")
+
+    def bulk_upsert(self, rows: list[dict], method: Literal["copy", "insert"] = "copy") -> int:
+        """
+        Like bulk_create, but updates existing publications instead of skipping them. The BM25 vector of publications
+        whose abstract changed is reset, so that it is recomputed by the next BM25 update. Does not commit.
+
+        Returns:
+            int: The number of inserted or updated publications.
+        """
+        return self._bulk_write(rows, method, on_conflict="update")
+
+    def _bulk_write(self, rows: list[dict], method: str, on_conflict: Literal["nothing", "update"]) -> int:
+        if not rows:
+            return 0
+        if method == "copy":
+            return self._bulk_write_copy(rows, on_conflict)
+        elif method == "insert":
+            return self._bulk_write_insert(rows, on_conflict)
+        else:
+            raise ValueError(f"Invalid bulk write method {method}")
+
+    def _on_conflict_sql(self, on_conflict: str) -> str:
+        if on_conflict == "nothing":
+            return "ON CONFLICT (openalex_id) DO NOTHING"
+        updates = ", ".join(
+            f"{column} = excluded.{column}" for column in self.bulk_columns if column != "openalex_id"
+        )
+        return f"ON CONFLICT (openalex_id) DO UPDATE SET {updates}, bm25 = {_upsert_bm25_sql}"
+
+    def _bulk_write_copy(self, rows: list[dict], on_conflict: str) -> int:
+        # COPY cannot handle conflicts, so rows are copied into a temporary staging table first
+        # pending ORM changes have to be flushed, as the COPY bypasses the session on the same connection
+        self.session.flush()
+        connection = self.session.connection().connection.driver_connection
+        if connection not in _vector_registered_connections:
+            register_vector(connection)
+            _vector_registered_connections.add(connection)
+
+        columns = ", ".join(self.bulk_columns)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TEMPORARY TABLE IF NOT EXISTS publication_staging ON COMMIT DROP AS "
+                f"SELECT {columns} FROM publication WITH NO DATA"
+            )
+            with cursor.copy(f"COPY publication_staging ({columns}) FROM STDIN WITH (FORMAT BINARY)") as copy:
+                copy.set_types(self._bulk_column_types)
+                for row in rows:
+                    copy.write_row(self._bulk_row_values(row, copy=True))
+            cursor.execute(
+                f"INSERT INTO publication ({columns}) SELECT {columns} FROM publication_staging "
+                f"{self._on_conflict_sql(on_conflict)}"
+            )
+            written = cursor.rowcount
+            cursor.execute("TRUNCATE publication_staging")
+        return written
+
+    def _bulk_write_insert(self, rows: list[dict], on_conflict: str) -> int:
+        values = [dict(zip(self.bulk_columns, self._bulk_row_values(row))) for row in rows]
+        statement = insert(Publication)
+        if on_conflict == "nothing":
+            statement = statement.on_conflict_do_nothing(index_elements=["openalex_id"])
+        else:
+            statement = statement.on_conflict_do_update(
+                index_elements=["openalex_id"],
+                set_={
+                    **{column: statement.excluded[column] for column in self.bulk_columns if column != "openalex_id"},
+                    "bm25": literal_column(_upsert_bm25_sql),
+                },
+            )
+        # executemany; SQLAlchemy batches the rows into multi-row INSERT statements ("insertmanyvalues")
+        return len(self.session.execute(statement.returning(Publication.openalex_id), values).all())
+
+    def _bulk_row_values(self, row: dict, copy: bool = False) -> list:
+        values = []
+        for column in self.bulk_columns:
+            value = row.get(column)
+            if column == "embedding":
+                value = np.asarray(value, dtype=np.float32)
+            elif column == "topics" and copy and value is not None:
+                # COPY bypasses SQLAlchemy's JSONB type, so the value has to be adapted for psycopg
+                value = Jsonb(value)
+            elif isinstance(value, datetime) and value.tzinfo is None:
+                # binary timestamptz requires timezone-aware datetimes, interpret naive ones as local time
+                value = value.astimezone()
+            values.append(value)
+        return values
+
     def get_by_openalex_id(self, openalex_id: int) -> Publication:
         return self.session.query(Publication).filter(Publication.openalex_id == openalex_id).one_or_none()
 
+    def get_by_openalex_ids(self, openalex_ids: list[int], batch_size: int = 10_000) -> list[Publication]:
+        """
+        Returns the stored publications among the given ids, in arbitrary order. The embedding and BM25 vector are not
+        loaded, as they are not needed to serve the publications.
+        """
+        publications = []
+        for i in range(0, len(openalex_ids), batch_size):
+            query = (
+                select(Publication)
+                .options(defer(Publication.embedding), defer(Publication.bm25))
+                .where(Publication.openalex_id.in_(openalex_ids[i : i + batch_size]))
+            )
+            publications.extend(self.session.scalars(query))
+        return publications
+
+    def get_embeddings_by_openalex_ids(
+        self, openalex_ids: list[int], batch_size: int = 10_000
+    ) -> dict[int, np.ndarray]:
+        """
+        Returns the stored embeddings of the given publications by their ids. Publications that are not stored are
+        missing from the result.
+        """
+        embeddings = {}
+        for i in range(0, len(openalex_ids), batch_size):
+            query = select(Publication.openalex_id, Publication.embedding).where(
+                Publication.openalex_id.in_(openalex_ids[i : i + batch_size])
+            )
+            embeddings.update((result.openalex_id, result.embedding) for result in self.session.execute(query))
+        return embeddings
+
+    def update_metadata(self, rows: list[dict]):
+        """
+        Update the OpenAlex metadata (topics, cited_by_count, created_datetime_utc) of stored publications, e.g. of
+        publications ingested before the metadata was persisted. Does not commit.
+
+        Parameters:
+            rows: Dicts with the keys openalex_id, topics, cited_by_count and created_datetime_utc.
+        """
+        if not rows:
+            return
+        statement = text(
+            """
+            UPDATE publication
+            SET topics = :topics, cited_by_count = :cited_by_count, created_datetime_utc = :created_datetime_utc
+            WHERE openalex_id = :openalex_id
+            """
+        ).bindparams(bindparam("topics", type_=JSONB))
+        self.session.execute(statement, rows)
+
     def get_all_openalex_ids(self) -> list[int]:
         results = self.session.query(Publication.openalex_id).all()
         return [result[0] for result in results]
 
+    def get_missing_openalex_ids(self, openalex_ids: list[int], batch_size: int = 10_000) -> list[int]:
+        """
+        Returns the ids among the given candidates that are not yet stored, in the order of the input.
+        Memory usage is bounded by the number of candidates, not by the size of the publication table.
+        """
+        query = text("""
+            SELECT candidate.id
+            FROM unnest(CAST(:ids AS bigint[])) WITH ORDINALITY AS candidate(id, position)
+            WHERE NOT EXISTS (SELECT 1 FROM publication WHERE publication.openalex_id = candidate.id)
+            ORDER BY candidate.position
+            """)
+        missing_ids = []
+        for i in range(0, len(openalex_ids), batch_size):
+            results = self.session.execute(query, {"ids": list(openalex_ids[i : i + batch_size])})
+            missing_ids.extend(result[0] for result in results)
+        return missing_ids
+
     def get_random_publications(self, n: int) -> list[Publication]:
         query = self.session.query(Publication).order_by(func.random()).limit(n)
         return query.all()
 
     def get_openalex_ids_by_embedding_similarity(
-        self, embedding: list[float], top_n: int, start_date: datetime = None
+        self,
+        embedding: list[float],
+        top_n: int,
+        start_date: datetime = None,
+        ef_search: int = None,
+        probes: int = None,
+        date_filter_mode: DateFilterMode = DateFilterMode.AUTO,
+        exact_selectivity_threshold: float = 0.05,
+        max_scan_tuples: int = None,
     ) -> tuple[list[int], list[float]]:
-        # Query to find the n most similar topics with similarity score (cosine similarity)
-        query = select(
-            Publication.openalex_id, (1 - Publication.embedding.cosine_distance(embedding)).label("similarity")
-        )
-        if start_date is not None:
-            query = query.where(Publication.publication_datetime_utc >= start_date)
-        query = query.order_by(desc("similarity")).limit(top_n)
+        """
+        Returns the ids and cosine similarities of the top_n publications most similar to the embedding.
+        ef_search (HNSW) and probes (IVFFlat) trade latency for recall if an ANN index exists, see vector_search_params.
+
+        If start_date is given, date_filter_mode determines how the date window is applied, so that top_n results are
+        returned even for restrictive windows (see DateFilterMode). With AUTO, windows estimated to contain less than
+        exact_selectivity_threshold of all publications are searched exactly. max_scan_tuples bounds iterative scans.
+        """
+        distance = Publication.embedding.cosine_distance(embedding)
+        params = {"ef_search": ef_search_for(top_n, ef_search), "probes": probes}
+        if start_date is None:
+            query = (
+                select(Publication.openalex_id, (1 - distance).label("similarity"))
+                .order_by(desc("similarity"))
+                .limit(top_n)
+            )
+        else:
+            date_filter_mode = self._resolve_date_filter_mode(date_filter_mode, start_date, exact_selectivity_threshold)
+            if date_filter_mode == DateFilterMode.EXACT:
+                # materializing the rows within the window prevents the planner from using the ANN index on them
+                candidates = (
+                    select(Publication.openalex_id, distance.label("distance"))
+                    .where(Publication.publication_datetime_utc >= start_date)
+                    .cte("candidates")
+                    .prefix_with("MATERIALIZED")
+                )
+                params = {}
+            else:
+                # iterative index scans with relaxed ordering, the final order is restored by the outer query
+                candidates = (
+                    select(Publication.openalex_id, distance.label("distance"))
+                    .where(Publication.publication_datetime_utc >= start_date)
+                    .order_by(distance)
+                    .limit(top_n)
+                    .cte("candidates")
+                    .prefix_with("MATERIALIZED")
+                )
+                params.update(iterative_scan="relaxed_order", max_scan_tuples=max_scan_tuples)
+            query = (
+                select(candidates.c.openalex_id, (1 - candidates.c.distance).label("similarity"))
+                .order_by(candidates.c.distance)
+                .limit(top_n)
+            )
 
-        results = self.session.execute(query).all()
+        with vector_search_params(self.session, **params):
+            results = self.session.execute(query).all()
 
         ids = [result.openalex_id for result in results]
         similarities = [result.similarity for result in results]
 
         return ids, similarities
 
+    def get_bm25_query_vector(self, query: str) -> str:
+        """Returns the BM25 sparse vector of the query in pgvector's text representation."""
+        return self.session.execute(
+            text("SELECT bm25_query_to_svector('publication_abstract_bm25', :query, 'pgvector')::text"),
+            {"query": query},
+        ).scalar()
+
+    def estimate_date_selectivity(self, start_date: datetime) -> float:
+        """
+        Estimate the fraction of publications published at or after start_date from the planner statistics,
+        without scanning the table.
+        """
+        total = self.session.execute(
+            text("SELECT reltuples FROM pg_class WHERE oid = 'publication'::regclass")
+        ).scalar()
+        if not total or total <= 0:
+            # table has never been analyzed
+            return 1.0
+        plan = self.session.execute(
+            text("EXPLAIN (FORMAT JSON) SELECT 1 FROM publication WHERE publication_datetime_utc >= :start_date"),
+            {"start_date": start_date},
+        ).scalar()
+        return min(1.0, plan[0]["Plan"]["Plan Rows"] / total)
+
+    def _resolve_date_filter_mode(
+        self, date_filter_mode: DateFilterMode, start_date: datetime, exact_selectivity_threshold: float
+    ) -> DateFilterMode:
+        if date_filter_mode == DateFilterMode.EXACT:
+            return date_filter_mode
+        if not self._supports_iterative_scan():
+            if date_filter_mode == DateFilterMode.ITERATIVE:
+                logger.warning("Iterative index scans require pgvector >= 0.8.0, falling back to exact search.")
+            return DateFilterMode.EXACT
+        if date_filter_mode == DateFilterMode.AUTO:
+            selectivity = self._date_selectivities.get(start_date)
+            if selectivity is None:
+                selectivity = self.estimate_date_selectivity(start_date)
+                self._date_selectivities.put(start_date, selectivity)
+            return DateFilterMode.EXACT if selectivity < exact_selectivity_threshold else DateFilterMode.ITERATIVE
+        return date_filter_mode
+
+    def _supports_iterative_scan(self) -> bool:
+        if self._iterative_scan_supported is None:
+            version = self.session.execute(
+                text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+            ).scalar()
+            major, minor = (int(part) for part in version.split(".")[:2])
+            self._iterative_scan_supported = (major, minor) >= (0, 8)
+        return self._iterative_scan_supported
+
+    def build_embedding_index(
+        self, index_type: VectorIndexType = VectorIndexType.HNSW, concurrently: bool = True, **options
+    ):
+        """
+        Build the ANN index on publication embeddings, if it does not exist yet. Building the index after a large
+        bulk ingestion (instead of maintaining it during the ingestion) is considerably faster. See build_vector_index
+        for the available options.
+        """
+        build_vector_index(self.session, "publication", "embedding", index_type, concurrently, **options)
+
+    def drop_embedding_index(self, index_type: VectorIndexType = VectorIndexType.HNSW, concurrently: bool = True):
+        drop_vector_index(self.session, "publication", "embedding", index_type, concurrently)
+
     def get_openalex_ids_by_bm25_similarity(
-        self, query: str, top_n: int, start_date: datetime = None
+        self,
+        query: str,
+        top_n: int,
+        start_date: datetime = None,
+        query_vector: str = None,
+        ef_search: int = None,
+        date_filter_mode: DateFilterMode = DateFilterMode.AUTO,
+        exact_selectivity_threshold: float = 0.05,
+        max_scan_tuples: int = None,
     ) -> tuple[list[int], list[float]]:
-        start_date_filter = ""
+        """
+        Returns the ids and BM25 scores of the top_n publications with the highest BM25 score for the query.
+
+        Only publications within the date window and with a BM25 vector are scored. If the HNSW index on the BM25
+        vectors exists (see build_bm25_index), the top_n publications are found via the index instead of scoring all
+        candidates; ef_search, date_filter_mode, exact_selectivity_threshold and max_scan_tuples then behave as in
+        get_openalex_ids_by_embedding_similarity.
+        """
+        # the query vector can be passed in if it has already been computed (see get_bm25_query_vector)
+        # otherwise, it is computed up front, so that it is a constant the index can be scanned with
+        if query_vector is None:
+            query_vector = self.get_bm25_query_vector(query)
+        query_text, params, search_params = self._bm25_search_query(
+            query_vector, top_n, start_date, ef_search, date_filter_mode, exact_selectivity_threshold, max_scan_tuples
+        )
+        with vector_search_params(self.session, **search_params):
+            results = self.session.execute(query_text, params).fetchall()
+
+        ids = [result[0] for result in results]
+        scores = [result[1] for result in results]
+
+        return ids, scores
+
+    def _bm25_search_query(
+        self,
+        query_vector: str,
+        top_n: int,
+        start_date: datetime | None,
+        ef_search: int | None,
+        date_filter_mode: DateFilterMode,
+        exact_selectivity_threshold: float,
+        max_scan_tuples: int | None,
+    ) -> tuple[TextClause, dict, dict]:
+        # returns the query, its parameters and the vector_search_params to execute it with
+        params = {"top_n": top_n, "query_vector": query_vector}
+        search_params = {"ef_search": ef_search_for(top_n, ef_search)}
+
+        filters = "bm25 IS NOT NULL"
+        order_limit = "ORDER BY distance LIMIT :top_n"
         if start_date is not None:
-            start_date_filter = "AND publication_datetime_utc >= :start_date"
+            filters += " AND publication_datetime_utc >= :start_date"
+            params["start_date"] = start_date
+            date_filter_mode = self._resolve_date_filter_mode(date_filter_mode, start_date, exact_selectivity_threshold)
+            if date_filter_mode == DateFilterMode.EXACT:
+                # materializing the scored rows prevents the planner from using the index on them
+                order_limit = ""
+                search_params = {}
+            else:
+                search_params.update(iterative_scan="relaxed_order", max_scan_tuples=max_scan_tuples)
 
+        # <#> is the negative inner product, so ascending distance means descending score
         query_raw = f"""
-        SELECT openalex_id, score
-        FROM
-        (
-            SELECT openalex_id, publication.publication_datetime_utc,
-                    -(bm25 <#> bm25_query_to_svector('publication_abstract_bm25', :query, 'pgvector')::sparsevec) AS score
+        WITH candidates AS MATERIALIZED (
+            SELECT openalex_id, bm25 <#> CAST(:query_vector AS sparsevec) AS distance
             FROM publication
-        ) subquery   
-        WHERE score != double precision 'NaN'
-        {start_date_filter}
-        ORDER BY score DESC
+            WHERE {filters}
+                AND (bm25 <#> CAST(:query_vector AS sparsevec)) != double precision 'NaN'
+            {order_limit}
+        )
+        SELECT openalex_id, -distance AS score
+        FROM candidates
+        ORDER BY distance
         LIMIT :top_n;
         """
+        return text(query_raw), params, search_params
+
+    def get_openalex_ids_by_hybrid_similarity(
+        self,
+        embedding: list[float],
+        query: str,
+        top_n: int,
+        start_date: datetime = None,
+        query_vector: str = None,
+        candidates_per_method: int = None,
+        weights: tuple[float, float] = (0.8, 0.2),
+        fusion: ScoreFusion = ScoreFusion.LINEAR,
+        normalize: bool = True,
+        rrf_k: int = 60,
+        ef_search: int = None,
+        date_filter_mode: DateFilterMode = DateFilterMode.AUTO,
+        exact_selectivity_threshold: float = 0.05,
+    ) -> tuple[list[int], list[float]]:
+        """
+        Hybrid search in a single statement: retrieves the top candidates by embedding similarity and by BM25 score,
+        and merges both rankings in the database.
 
-        query_text = text(query_raw)
-        params = {"query": query, "top_n": top_n}
+        Parameters:
+            embedding: Embedding of the query.
+            query: The query.
+            top_n: Number of results.
+            start_date: Only consider publications published at or after this date.
+            query_vector: BM25 vector of the query if already computed (see get_bm25_query_vector), otherwise it is
+                computed once within the statement.
+            candidates_per_method: Number of candidates retrieved by each method. Defaults to 2 * top_n.
+            weights: Weights of the semantic and the BM25 ranking.
+            fusion: How the rankings are merged, see ScoreFusion.
+            normalize: LINEAR only: Min-max normalize the scores of each method before weighting them.
+            rrf_k: RRF only: Rank offset, larger values reduce the influence of the top ranks.
+            ef_search, date_filter_mode, exact_selectivity_threshold: See get_openalex_ids_by_embedding_similarity.
+
+        Returns:
+            tuple[list[int], list[float]]: The ids and merged scores of the top_n publications, best first.
+        """
+        if fusion == ScoreFusion.RRF:
+            merged_score = "weight / (:rrf_k + rank)"
+        elif fusion == ScoreFusion.LINEAR and normalize:
+            # all scores of a method are 0 if they are identical, like in _normalize_scores of the PublicationService
+            merged_score = "weight * coalesce((score - min_score) / nullif(max_score - min_score, 0), 0)"
+        elif fusion == ScoreFusion.LINEAR:
+            merged_score = "weight * score"
+        else:
+            raise ValueError(f"Invalid score fusion {fusion}")
+
+        k = candidates_per_method if candidates_per_method is not None else top_n * 2
+        params = {
+            "embedding": embedding,
+            "k": k,
+            "top_n": top_n,
+            "semantic_weight": weights[0],
+            "bm25_weight": weights[1],
+            "rrf_k": rrf_k,
+        }
+        search_params = {"ef_search": ef_search_for(k, ef_search)}
+
+        date_filter = ""
+        exact = False
         if start_date is not None:
+            date_filter = "AND publication_datetime_utc >= :start_date"
             params["start_date"] = start_date
+            date_filter_mode = self._resolve_date_filter_mode(date_filter_mode, start_date, exact_selectivity_threshold)
+            if date_filter_mode == DateFilterMode.EXACT:
+                exact = True
+                search_params = {}
+            else:
+                search_params.update(iterative_scan="relaxed_order")
+
+        def top_k(name: str, distance: str, filters: str) -> str:
+            # CTE with the k best candidates of one method, date windows are handled like in the single-method searches
+            if exact:
+                return f"""
+            {name}_window AS MATERIALIZED (
+                SELECT openalex_id, {distance} AS distance FROM publication WHERE {filters}
+            ),
+            {name} AS (
+                SELECT openalex_id, distance FROM {name}_window ORDER BY distance LIMIT :k
+            )"""
+            return f"""
+            {name} AS MATERIALIZED (
+                SELECT openalex_id, {distance} AS distance FROM publication WHERE {filters}
+                ORDER BY distance LIMIT :k
+            )"""
+
+        query_vector_cte = ""
+        if query_vector is not None:
+            bm25_distance = "bm25 <#> CAST(:query_vector AS sparsevec)"
+            params["query_vector"] = query_vector
+        else:
+            # vectorized once, as an InitPlan parameter, which the planner treats as a constant that the index can
+            # scan with, instead of calling bm25_query_to_svector for every row
+            query_vector_cte = """
+            bm25_query AS MATERIALIZED (
+                SELECT bm25_query_to_svector('publication_abstract_bm25', :query, 'pgvector')::sparsevec AS vector
+            ),"""
+            bm25_distance = "bm25 <#> (SELECT vector FROM bm25_query)"
+            params["query"] = query
+        semantic_cte = top_k("semantic", "embedding <=> :embedding", f"TRUE {date_filter}")
+        bm25_cte = top_k(
+            "bm25", bm25_distance, f"bm25 IS NOT NULL AND ({bm25_distance}) != double precision 'NaN' {date_filter}"
+        )
+        query_raw = f"""
+        WITH {query_vector_cte}{semantic_cte},{bm25_cte},
+            ranked AS (
+                SELECT 'semantic' AS method, openalex_id, 1 - distance AS score,
+                    row_number() OVER (ORDER BY distance) AS rank, CAST(:semantic_weight AS double precision) AS weight
+                FROM semantic
+                UNION ALL
+                SELECT 'bm25' AS method, openalex_id, -distance AS score,
+                    row_number() OVER (ORDER BY distance) AS rank, CAST(:bm25_weight AS double precision) AS weight
+                FROM bm25
+            ),
+            scored AS (
+                SELECT openalex_id, score, rank, weight,
+                    min(score) OVER (PARTITION BY method) AS min_score,
+                    max(score) OVER (PARTITION BY method) AS max_score
+                FROM ranked
+            )
+        SELECT openalex_id, sum({merged_score}) AS score
+        FROM scored
+        GROUP BY openalex_id
+        ORDER BY score DESC
+        LIMIT :top_n;
+        """
+        query_text = text(query_raw).bindparams(bindparam("embedding", type_=Vector()))
 
-        results = self.session.execute(query_text, params).fetchall()
+        with vector_search_params(self.session, **search_params):
+            results = self.session.execute(query_text, params).fetchall()
 
         ids = [result[0] for result in results]
         scores = [result[1] for result in results]
 
         return ids, scores
 
-    def rebuild_bm25(self):
-        # First, check if the materialized statistics view already exists
-        view_exists = self.session.execute(
+    def build_bm25_index(self, concurrently: bool = True, **options):
+        """
+        Build an HNSW index (inner product) on the BM25 vectors, if it does not exist yet, so that BM25 retrieval no
+        longer scores every publication. pgvector can only index sparse vectors with at most 1000 non-zero elements.
+        The index slows down rebuild_bm25, which rewrites all vectors. See build_vector_index for the options.
+        """
+        build_vector_index(
+            self.session,
+            "publication",
+            "bm25",
+            VectorIndexType.HNSW,
+            concurrently,
+            operator_class="sparsevec_ip_ops",
+            **options,
+        )
+
+    def drop_bm25_index(self, concurrently: bool = True):
+        drop_vector_index(self.session, "publication", "bm25", VectorIndexType.HNSW, concurrently)
+
+    def update_bm25(self, drift_threshold: float = None, full: bool = False) -> bool:
+        """
+        Bring the BM25 vectors up to date after publications were added or changed. Commits.
+
+        BM25 document vectors depend on corpus statistics (e.g. the average document length). By default, only the
+        publications without a BM25 vector are vectorized, using the statistics of the last full refresh, so that the
+        cost grows with the number of new publications instead of the corpus size. All vectors are recomputed with
+        fresh statistics (see rebuild_bm25) if there are no statistics yet, if full is set, or if the corpus has
+        drifted from the statistics by more than drift_threshold (see get_bm25_drift).
+
+        Parameters:
+            drift_threshold: Maximum tolerated drift. Defaults to bm25_drift_threshold.
+            full: Always recompute all vectors.
+
+        Returns:
+            bool: Whether all vectors were recomputed.
+        """
+        if drift_threshold is None:
+            drift_threshold = self.bm25_drift_threshold
+        statistics = self.session.get(Bm25Statistics, 1)
+        if full or statistics is None or not self._bm25_view_exists():
+            self.rebuild_bm25()
+            return True
+
+        vectorized_lengths = self.session.execute(
+            text("""
+            UPDATE publication
+            SET bm25 = bm25_document_to_svector('publication_abstract_bm25', abstract, 'pgvector')::sparsevec
+            WHERE bm25 IS NULL AND abstract IS NOT NULL
+            RETURNING length(abstract);
+            """)
+        ).scalars().all()
+        statistics.documents_since_refresh += len(vectorized_lengths)
+        statistics.length_since_refresh += sum(vectorized_lengths)
+        self.commit()
+        logger.info(f"Computed BM25 vectors of {len(vectorized_lengths)} publications.")
+
+        drift = self.get_bm25_drift(statistics)
+        if drift > drift_threshold:
+            logger.info(f"BM25 statistics drifted by {drift:.1%}, recomputing all BM25 vectors.")
+            self.rebuild_bm25()
+            return True
+        return False
+
+    @staticmethod
+    def get_bm25_drift(statistics: Bm25Statistics) -> float:
+        """
+        Relative drift of the corpus from the statistics the BM25 vectors were computed with: the larger of the
+        fraction of publications vectorized since the last full refresh and the relative change of the average
+        abstract length.
+        """
+        if statistics.document_count == 0:
+            return float("inf") if statistics.documents_since_refresh else 0.0
+        count_drift = statistics.documents_since_refresh / statistics.document_count
+        total_length = statistics.average_length * statistics.document_count + statistics.length_since_refresh
+        average_length = total_length / (statistics.document_count + statistics.documents_since_refresh)
+        length_drift = abs(average_length - statistics.average_length) / max(statistics.average_length, 1.0)
+        return max(count_drift, length_drift)
+
+    def _bm25_view_exists(self) -> bool:
+        return self.session.execute(
             text("""
                 SELECT EXISTS (
                     SELECT FROM pg_matviews 
@@ -107,7 +714,13 @@ class PublicationRepository:
                 );
                 """)
         ).scalar()
-        if view_exists:
+
+    def rebuild_bm25(self):
+        """
+        Recompute the BM25 corpus statistics and the BM25 vectors of all publications. Commits.
+        Rewrites the whole table, prefer update_bm25 after ingesting publications.
+        """
+        if self._bm25_view_exists():
             # refresh
             self.session.execute(
                 text("""
@@ -127,6 +740,19 @@ class PublicationRepository:
             SET bm25 = bm25_document_to_svector('publication_abstract_bm25', abstract, 'pgvector')::sparsevec;
             """)
         )
+
+        document_count, average_length = self.session.execute(
+            text("SELECT count(*), coalesce(avg(length(abstract)), 0) FROM publication WHERE abstract IS NOT NULL")
+        ).one()
+        statistics = self.session.get(Bm25Statistics, 1)
+        if statistics is None:
+            statistics = Bm25Statistics(id=1)
+            self.session.add(statistics)
+        statistics.document_count = document_count
+        statistics.average_length = float(average_length)
+        statistics.documents_since_refresh = 0
+        statistics.length_since_refresh = 0
+        statistics.refreshed_datetime_utc = datetime.now(timezone.utc)
         self.commit()
 
     def count(self) -> int:
@@ -0,0 +1,42 @@
+import hashlib
+from datetime import date, datetime, timezone
+
+from core.sqlalchemy_models import SyncState
+from db import Session
+
+
+class SyncStateRepository:
+    def __init__(self, session: Session):
+        self.session = session
+
+    def commit(self):
+        self.session.commit()
+
+    @staticmethod
+    def key(topic_ids: list[int]) -> str:
+        topics = ",".join(str(topic_id) for topic_id in sorted(set(topic_ids)))
+        return hashlib.sha256(topics.encode("utf-8")).hexdigest()
+
+    def get(self, topic_ids: list[int]) -> SyncState | None:
+        return self.session.get(SyncState, self.key(topic_ids))
+
+    def advance(
+        self, topic_ids: list[int], latest_publication_date: date, latest_created_date: date | None
+    ) -> SyncState:
+        """
+        Record a completed sync of the topics. The watermarks only move forward. Does not commit.
+        """
+        key = self.key(topic_ids)
+        state = self.session.get(SyncState, key)
+        if state is None:
+            state = SyncState(
+                key=key, topic_ids=sorted(set(topic_ids)), latest_publication_date=latest_publication_date
+            )
+            self.session.add(state)
+        state.latest_publication_date = max(state.latest_publication_date, latest_publication_date)
+        if state.latest_created_date is None or (
+            latest_created_date is not None and latest_created_date > state.latest_created_date
+        ):
+            state.latest_created_date = latest_created_date
+        state.synced_datetime_utc = datetime.now(timezone.utc)
+        return state
@@ -1,23 +1,66 @@
-from sqlalchemy import select, desc
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import select, desc, text, bindparam
 
 from core.sqlalchemy_models.openalex.topic import Topic
 from db import Session
+from .vector_index import ef_search_for, vector_search_params
 
 
 class TopicRepository:
     def __init__(self, session: Session):
         self.session = session
 
-    def get_topics_by_embedding_similarity(self, embedding: list[float], top_n: int) -> tuple[list[Topic], list[float]]:
+    def get_topics_by_embedding_similarity(
+        self, embedding: list[float], top_n: int, ef_search: int = None, probes: int = None
+    ) -> tuple[list[Topic], list[float]]:
         # Query to find the n most similar topics with similarity score (cosine similarity)
         query = (
             select(Topic, (1 - Topic.embedding.cosine_distance(embedding)).label("similarity"))
             .order_by(desc("similarity"))
             .limit(top_n)
         )
-        results = self.session.execute(query).all()
+        with vector_search_params(self.session, ef_search=ef_search_for(top_n, ef_search), probes=probes):
+            results = self.session.execute(query).all()
 
         topics = [result.Topic for result in results]
         similarities = [result.similarity for result in results]
 
         return topics, similarities
+
+    def get_topics_by_embedding_similarity_batch(
+        self, embeddings: list[list[float]], top_n: int, ef_search: int = None, probes: int = None
+    ) -> list[tuple[list[Topic], list[float]]]:
+        """
+        Like get_topics_by_embedding_similarity, for many embeddings in a single query.
+        Returns the topics and similarities of each embedding, in the order of the embeddings.
+        """
+        if not embeddings:
+            return []
+        values = ", ".join(f"({i}, CAST(:embedding_{i} AS vector))" for i in range(len(embeddings)))
+        query = text(
+            f"""
+            SELECT queries.query_index, matches.id, 1 - matches.distance AS similarity
+            FROM (VALUES {values}) AS queries(query_index, embedding)
+            CROSS JOIN LATERAL (
+                SELECT id, embedding <=> queries.embedding AS distance
+                FROM openalex_topic
+                ORDER BY distance
+                LIMIT :top_n
+            ) matches
+            ORDER BY queries.query_index, matches.distance
+            """
+        ).bindparams(*(bindparam(f"embedding_{i}", type_=Vector()) for i in range(len(embeddings))))
+        params = {"top_n": top_n, **{f"embedding_{i}": embedding for i, embedding in enumerate(embeddings)}}
+        with vector_search_params(self.session, ef_search=ef_search_for(top_n, ef_search), probes=probes):
+            results = self.session.execute(query, params).all()
+
+        topics_by_id = {
+            topic.id: topic
+            for topic in self.session.scalars(select(Topic).where(Topic.id.in_({result.id for result in results})))
+        }
+        matches = [([], []) for _ in embeddings]
+        for result in results:
+            topics, similarities = matches[result.query_index]
+            topics.append(topics_by_id[result.id])
+            similarities.append(result.similarity)
+        return matches
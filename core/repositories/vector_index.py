@@ -0,0 +1,172 @@
+import math
+from contextlib import contextmanager
+from enum import Enum
+
+from sqlalchemy import text
+
+from db import Session
+
+
+class VectorIndexType(Enum):
+    HNSW = "hnsw"
+    IVFFLAT = "ivfflat"
+
+
+class DateFilterMode(Enum):
+    """
+    How similarity search is executed when results are restricted to a date window.
+
+    ANN index scans apply filters after the index has produced its candidates, so a selective filter can leave fewer
+    than the requested number of results.
+    EXACT: Scan only the rows within the window (located via the btree index on the date) and rank them exactly.
+        Correct and fast for selective windows, but cost grows linearly with the number of rows in the window.
+    ITERATIVE: Let the ANN index continue scanning until enough rows pass the filter (pgvector >= 0.8.0).
+        Fast for non-selective windows.
+    AUTO: Choose EXACT or ITERATIVE based on the planner's estimate of the window's selectivity.
+    """
+
+    AUTO = "auto"
+    EXACT = "exact"
+    ITERATIVE = "iterative"
+
+
+# pgvector's defaults of the knobs set by vector_search_params, see https://github.com/pgvector/pgvector
+_default_search_settings = {
+    "hnsw.ef_search": "40",
+    "ivfflat.probes": "1",
+    "hnsw.iterative_scan": "off",
+    "ivfflat.iterative_scan": "off",
+    "hnsw.max_scan_tuples": "20000",
+}
+
+
+def vector_index_name(table: str, column: str, index_type: VectorIndexType) -> str:
+    return f"{table}_{column}_{index_type.value}_idx"
+
+
+def ef_search_for(top_n: int, ef_search: int = None) -> int | None:
+    """
+    HNSW index scans return at most ef_search rows, so ef_search must be at least top_n for the query to return top_n
+    results. Returns the ef_search to use, or None if pgvector's default (40) suffices.
+    """
+    if ef_search is None and top_n > 40:
+        ef_search = top_n
+    # pgvector accepts values up to 1000
+    return min(ef_search, 1000) if ef_search is not None else None
+
+
+@contextmanager
+def vector_search_params(
+    session: Session,
+    ef_search: int = None,
+    probes: int = None,
+    iterative_scan: str = None,
+    max_scan_tuples: int = None,
+):
+    """
+    Set pgvector's recall/latency knobs for the queries executed within the context.
+
+    Higher values increase recall of approximate nearest neighbor search at the cost of latency:
+    ef_search is the size of the candidate list of HNSW indexes (pgvector default: 40, must be >= the number of
+    requested results), probes is the number of lists scanned in IVFFlat indexes (pgvector default: 1).
+    iterative_scan ("strict_order" or "relaxed_order", pgvector >= 0.8.0) makes filtered index scans continue until
+    enough rows pass the filter, bounded by max_scan_tuples for HNSW. IVFFlat only supports "relaxed_order", so with
+    "strict_order" only HNSW index scans are iterative.
+    The settings are transaction-local and applied in a single statement. They are not restored when the context
+    exits, which would take another round trip, but knobs changed by a previous context in the same transaction are
+    reset to their original values by the next one, in the same statement. Only vector index scans read the settings,
+    and they all run within this context.
+    """
+    settings = {
+        "hnsw.ef_search": ef_search,
+        "ivfflat.probes": probes,
+        "hnsw.iterative_scan": iterative_scan,
+        "ivfflat.iterative_scan": iterative_scan if iterative_scan == "relaxed_order" else None,
+        "hnsw.max_scan_tuples": max_scan_tuples,
+    }
+    settings = {name: str(value) for name, value in settings.items() if value is not None}
+    # values of the knobs before any context changed them
+    original_settings = session.info.setdefault("vector_search_original_settings", {})
+    values = {**original_settings, **settings}
+    if values:
+        # the lateral subquery (not flattened due to OFFSET 0) reads the previous value before set_config overwrites it
+        previous = session.execute(
+            text(
+                "SELECT setting.name, previous.value, set_config(setting.name, setting.value, true) "
+                "FROM unnest(CAST(:names AS text[]), CAST(:values AS text[])) AS setting(name, value), "
+                "LATERAL (SELECT current_setting(setting.name, true) AS value OFFSET 0) AS previous"
+            ),
+            {"names": list(values), "values": list(values.values())},
+        ).fetchall()
+        # knobs that are not in original_settings yet have not been changed by a previous context. Their value is
+        # unknown (None) until pgvector is loaded by the connection, i.e. it is pgvector's default
+        for name, value, _ in previous:
+            original_settings.setdefault(name, value if value is not None else _default_search_settings[name])
+    yield
+
+
+def build_vector_index(
+    session: Session,
+    table: str,
+    column: str = "embedding",
+    index_type: VectorIndexType = VectorIndexType.HNSW,
+    concurrently: bool = True,
+    m: int = 16,
+    ef_construction: int = 64,
+    lists: int = None,
+    maintenance_work_mem: str = None,
+    operator_class: str = "vector_cosine_ops",
+):
+    """
+    Build an ANN index on a vector column, if it does not exist yet.
+
+    With concurrently=True, the index is built without blocking writes to the table, e.g. after a bulk ingestion. As
+    CREATE INDEX CONCURRENTLY cannot run inside a transaction, the index is built on a separate autocommit connection.
+
+    Parameters:
+        session: Session whose engine is used.
+        table: Name of the table.
+        column: Name of the vector column.
+        index_type: HNSW (better recall/latency trade-off, slower to build) or IVFFlat (fast to build, needs data).
+        concurrently: Build the index without locking out writes.
+        m: HNSW: maximum number of connections per layer.
+        ef_construction: HNSW: size of the candidate list during construction.
+        lists: IVFFlat: number of lists. Defaults to rows / 1000 for up to 1M rows and sqrt(rows) above.
+        maintenance_work_mem: Memory for the index build (e.g. "2GB"); builds are much faster if the index fits.
+        operator_class: Distance the index supports, e.g. "vector_cosine_ops" or "sparsevec_ip_ops" (HNSW only).
+    """
+    name = vector_index_name(table, column, index_type)
+    if index_type == VectorIndexType.HNSW:
+        options = f"m = {int(m)}, ef_construction = {int(ef_construction)}"
+    else:
+        if lists is None:
+            rows = session.execute(text(f"SELECT count(*) FROM {table}")).scalar()
+            lists = rows // 1000 if rows <= 1_000_000 else int(math.sqrt(rows))
+        options = f"lists = {max(1, int(lists))}"
+
+    with session.get_bind().connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        if maintenance_work_mem is not None:
+            connection.execute(
+                text("SELECT set_config('maintenance_work_mem', :value, false)"), {"value": maintenance_work_mem}
+            )
+        connection.execute(
+            text(
+                f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {name} "
+                f"ON {table} USING {index_type.value} ({column} {operator_class}) WITH ({options})"
+            )
+        )
+        if maintenance_work_mem is not None:
+            connection.execute(text("RESET maintenance_work_mem"))
+
+
+def drop_vector_index(
+    session: Session,
+    table: str,
+    column: str = "embedding",
+    index_type: VectorIndexType = VectorIndexType.HNSW,
+    concurrently: bool = True,
+):
+    """Drop an ANN index created by build_vector_index, e.g. before a large bulk ingestion."""
+    name = vector_index_name(table, column, index_type)
+    with session.get_bind().connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text(f"DROP INDEX {'CONCURRENTLY ' if concurrently else ''}IF EXISTS {name}"))
@@ -0,0 +1,79 @@
+import numpy as np
+
+
+class MMRPruner:
+    """
+    Cheap middle stage between retrieval and LLM reranking. Candidates are scored by the cosine similarity of their
+    stored embeddings to the query embedding and pruned to a pool with maximal marginal relevance (MMR), which trades
+    similarity to the query off against similarity to the candidates already in the pool, so that near duplicates do
+    not crowd out other relevant candidates.
+
+    The pool size adapts to the query: it covers all candidates that are almost as similar to the query as the k-th
+    most similar one, within [min_pool_factor * k, max_pool_factor * k]. Queries with a clear top k get a small pool,
+    queries with many similarly scored candidates a larger one.
+    """
+
+    def __init__(
+        self,
+        diversity: float = 0.2,
+        min_pool_factor: float = 2,
+        max_pool_factor: float = 5,
+        similarity_margin: float = 0.1,
+    ):
+        """
+        Parameters:
+            diversity: Weight of the redundancy penalty in MMR, between 0 (similarity only) and 1 (diversity only).
+            min_pool_factor: Minimum pool size, as a multiple of k.
+            max_pool_factor: Maximum pool size, as a multiple of k.
+            similarity_margin: Candidates whose similarity to the query is at most this much lower than the k-th
+                highest similarity count towards the pool size.
+        """
+        if not 0 <= diversity <= 1:
+            raise ValueError("diversity must be between 0 and 1.")
+        if not 1 <= min_pool_factor <= max_pool_factor:
+            raise ValueError("min_pool_factor must be at least 1 and at most max_pool_factor.")
+        self.diversity = diversity
+        self.min_pool_factor = min_pool_factor
+        self.max_pool_factor = max_pool_factor
+        self.similarity_margin = similarity_margin
+
+    def pool_size(self, similarities: np.ndarray, k: int) -> int:
+        """Returns the pool size for candidates with the given similarities to the query."""
+        if len(similarities) <= k:
+            return len(similarities)
+        kth_similarity = np.partition(similarities, len(similarities) - k)[len(similarities) - k]
+        num_close = int(np.count_nonzero(similarities >= kth_similarity - self.similarity_margin))
+        size = max(int(self.min_pool_factor * k), min(int(self.max_pool_factor * k), num_close))
+        return min(size, len(similarities))
+
+    def prune(self, query_embedding, embeddings, k: int) -> list[int]:
+        """
+        Select the pool of candidates to rerank.
+
+        Parameters:
+            query_embedding: Embedding of the query.
+            embeddings: Embeddings of the candidates, one row per candidate.
+            k: Number of results the reranker should return.
+
+        Returns:
+            list[int]: Indices of the candidates in the pool, in input order.
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if len(embeddings) == 0:
+            return []
+        embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        query_embedding = np.asarray(query_embedding, dtype=np.float32)
+        similarities = embeddings @ (query_embedding / np.linalg.norm(query_embedding))
+
+        pool_size = self.pool_size(similarities, k)
+        # highest similarity to a pooled candidate, the redundancy of each candidate
+        redundancy = np.zeros(len(embeddings), dtype=np.float32)
+        scores = np.empty(len(embeddings), dtype=np.float32)
+        pooled = np.zeros(len(embeddings), dtype=bool)
+        for _ in range(pool_size):
+            np.subtract((1 - self.diversity) * similarities, self.diversity * redundancy, out=scores)
+            scores[pooled] = -np.inf
+            selected = int(np.argmax(scores))
+            pooled[selected] = True
+            np.maximum(redundancy, embeddings @ embeddings[selected], out=redundancy)
+        return np.flatnonzero(pooled).tolist()
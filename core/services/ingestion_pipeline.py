@@ -0,0 +1,176 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from typing import Generic, TypeVar
+
+logger = logging.getLogger(__name__)
+
+Batch = TypeVar("Batch")
+Embeddings = TypeVar("Embeddings")
+
+
+class StageMetrics:
+    """
+    Throughput of a pipeline stage. busy_seconds is the time spent working (summed over the stage's workers),
+    blocked_seconds the time spent waiting on a neighboring stage, i.e. backpressure or starvation.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.batches = 0
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, items: int, busy_seconds: float):
+        with self._lock:
+            self.batches += 1
+            self.items += items
+            self.busy_seconds += busy_seconds
+
+    def record_blocked(self, seconds: float):
+        with self._lock:
+            self.blocked_seconds += seconds
+
+    @property
+    def throughput(self) -> float:
+        """Items per busy second."""
+        return self.items / self.busy_seconds if self.busy_seconds else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.name}: {self.items} items in {self.batches} batches, busy {self.busy_seconds:.1f}s "
+            f"({self.throughput:.1f} items/s), blocked {self.blocked_seconds:.1f}s"
+        )
+
+
+class _Failure:
+    # passes an exception of the harvest thread to the consuming thread
+    def __init__(self, exception: BaseException):
+        self.exception = exception
+
+
+_end_of_stream = object()
+
+
+class IngestionPipeline(Generic[Batch, Embeddings]):
+    """
+    Overlaps harvesting, embedding and writing of batches, so that network, API and database time are not spent
+    sequentially.
+
+    The harvest stage runs in its own thread and hands batches to the embedding stage through a bounded queue. Up to
+    embedding_workers batches are embedded concurrently. The write stage runs in the calling thread and writes the
+    batches in harvest order, so that e.g. a checkpoint committed with a batch covers all batches before it. Bounded
+    queues apply backpressure: the harvest pauses if embedding falls behind, and no more batches are embedded while
+    the oldest batch is still waiting to be written. An exception in any stage stops the pipeline and is raised by run.
+    """
+
+    def __init__(
+        self,
+        harvest: Callable[[], Iterator[Batch]],
+        embed: Callable[[Batch], Embeddings],
+        write: Callable[[Batch, Embeddings], None],
+        batch_size: Callable[[Batch], int] = len,
+        embedding_workers: int = 2,
+        queue_size: int = 2,
+    ):
+        """
+        Parameters:
+            harvest: Returns an iterator over the batches. The iterator is consumed in a separate thread.
+            embed: Computes the embeddings of a batch. Called from embedding_workers threads concurrently.
+            write: Writes a batch with its embeddings. Called in the thread calling run, in harvest order.
+            batch_size: Number of items in a batch, used for the metrics.
+            embedding_workers: Maximum number of batches embedded concurrently.
+            queue_size: Maximum number of harvested batches waiting to be embedded.
+        """
+        if embedding_workers < 1 or queue_size < 1:
+            raise ValueError("embedding_workers and queue_size must be at least 1.")
+        self.harvest = harvest
+        self.embed = embed
+        self.write = write
+        self.batch_size = batch_size
+        self.embedding_workers = embedding_workers
+        self.queue_size = queue_size
+        self.metrics = {name: StageMetrics(name) for name in ("harvest", "embed", "write")}
+
+    def run(self) -> dict[str, StageMetrics]:
+        """Run the pipeline until all batches are written. Returns the metrics of the stages."""
+        harvested = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        harvest_thread = threading.Thread(
+            target=self._run_harvest, args=(harvested, stop), name="ingestion-harvest", daemon=True
+        )
+        harvest_thread.start()
+        start = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(self.embedding_workers, thread_name_prefix="ingestion-embed") as executor:
+                in_flight = deque()
+                while True:
+                    blocked_since = time.perf_counter()
+                    batch = harvested.get()
+                    self.metrics["embed"].record_blocked(time.perf_counter() - blocked_since)
+                    if batch is _end_of_stream:
+                        break
+                    if isinstance(batch, _Failure):
+                        raise batch.exception
+                    in_flight.append((batch, executor.submit(self._run_embed, batch)))
+                    if len(in_flight) >= self.embedding_workers:
+                        self._write_next(in_flight)
+                while in_flight:
+                    self._write_next(in_flight)
+        finally:
+            stop.set()
+            harvest_thread.join()
+
+        elapsed = time.perf_counter() - start
+        items = self.metrics["write"].items
+        logger.info(f"Ingested {items} items in {elapsed:.1f}s ({items / elapsed if elapsed else 0.0:.1f} items/s).")
+        for metrics in self.metrics.values():
+            logger.info(str(metrics))
+        return self.metrics
+
+    def _run_harvest(self, harvested: queue.Queue, stop: threading.Event):
+        try:
+            batches = self.harvest()
+            while not stop.is_set():
+                started = time.perf_counter()
+                batch = next(batches, _end_of_stream)
+                if batch is _end_of_stream:
+                    self._put(harvested, batch, stop)
+                    return
+                self.metrics["harvest"].record(self.batch_size(batch), time.perf_counter() - started)
+                blocked_since = time.perf_counter()
+                self._put(harvested, batch, stop)
+                self.metrics["harvest"].record_blocked(time.perf_counter() - blocked_since)
+        except BaseException as e:
+            self._put(harvested, _Failure(e), stop)
+
+    @staticmethod
+    def _put(harvested: queue.Queue, item, stop: threading.Event):
+        # waits for space in the queue, unless the pipeline is stopped (the consumer is gone)
+        while not stop.is_set():
+            try:
+                harvested.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _run_embed(self, batch: Batch) -> Embeddings:
+        started = time.perf_counter()
+        embeddings = self.embed(batch)
+        self.metrics["embed"].record(self.batch_size(batch), time.perf_counter() - started)
+        return embeddings
+
+    def _write_next(self, in_flight: deque):
+        batch, future = in_flight.popleft()
+        blocked_since = time.perf_counter()
+        embeddings = future.result()
+        self.metrics["write"].record_blocked(time.perf_counter() - blocked_since)
+        started = time.perf_counter()
+        self.write(batch, embeddings)
+        self.metrics["write"].record(self.batch_size(batch), time.perf_counter() - started)
@@ -0,0 +1,128 @@
+import logging
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+
+import pyalex
+import requests
+from pyalex.api import OpenAlexAuth
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+from core.dataclasses.data_classes import Work
+
+logger = logging.getLogger(__name__)
+
+
+class WorksPage:
+    """
+    A page of works returned by cursor pagination.
+
+    Parameters:
+        works: The works on the page.
+        cursor: The cursor the page was requested with.
+        next_cursor: The cursor of the next page, None if this is the last page.
+    """
+
+    def __init__(self, works: list[Work], cursor: str, next_cursor: str | None):
+        self.works = works
+        self.cursor = cursor
+        self.next_cursor = next_cursor
+
+
+class OpenAlexClient:
+    """
+    Client for bulk requests to the OpenAlex API, sharing a pool of keep-alive connections between concurrent requests.
+    Uses pyalex's configuration (pyalex.config), e.g. the contact email for the polite pool.
+    """
+
+    # OpenAlex allows filtering by at most 100 ids per request
+    max_ids_per_request = 100
+
+    def __init__(self, max_workers: int = 8, max_retries: int = 5, backoff_factor: float = 0.5):
+        """
+        Parameters:
+            max_workers: Maximum number of concurrent requests, also the size of the connection pool.
+            max_retries: Retries of requests failing with a connection error, rate limit (429) or server error.
+            backoff_factor: Base of the exponential backoff between retries in seconds. Retry-After is respected.
+        """
+        self.max_workers = max_workers
+        self.session = requests.Session()
+        retries = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods={"GET"},
+            respect_retry_after_header=True,
+        )
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=max_workers, max_retries=retries))
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="openalex")
+
+    def get(self, path: str, params: dict) -> dict:
+        return self.get_url(f"{pyalex.config.openalex_url}/{path}", params)
+
+    def get_url(self, url: str, params: dict = None) -> dict:
+        # params are added to the query string of the url, e.g. of a pyalex query's url
+        response = self.session.get(url, params=params, auth=OpenAlexAuth(pyalex.config))
+        response.raise_for_status()
+        return response.json()
+
+    def iter_works_pages(
+        self, query: pyalex.Works, cursor: str = "*", per_page: int = 200, n_max: int = None
+    ) -> Iterator[WorksPage]:
+        """
+        Iterate over the works matching a pyalex query page by page, using cursor pagination. Only one page is held in
+        memory at a time. Iteration can be resumed by passing the next_cursor of the last processed page.
+
+        Parameters:
+            query: The query, e.g. pyalex.Works().filter(...).sort(...).
+            cursor: The cursor to start at, "*" for the first page.
+            per_page: Number of works per page, at most 200.
+            n_max: Maximum number of works, unlimited if None.
+        """
+        works_returned = 0
+        while cursor is not None and (n_max is None or works_returned < n_max):
+            response = self.get_url(query.url, {"cursor": cursor, "per-page": per_page})
+            results = response["results"]
+            if n_max is not None:
+                results = results[: n_max - works_returned]
+            next_cursor = response["meta"].get("next_cursor") if results else None
+            works = [Work(pyalex.Work(result)) for result in results]
+            works_returned += len(works)
+            yield WorksPage(works, cursor, next_cursor)
+            cursor = next_cursor
+
+    def get_works_by_ids(self, openalex_ids: list[int]) -> tuple[list[Work], list[int]]:
+        """
+        Fetch works by their ids, requesting chunks of max_ids_per_request ids concurrently.
+
+        Returns:
+            tuple[list[Work], list[int]]: The works in the order of the ids (duplicates are returned once per
+                occurrence), and the ids OpenAlex returned no work for (e.g. deleted or merged works).
+        """
+        distinct_ids = list(dict.fromkeys(openalex_ids))
+        chunks = [
+            distinct_ids[i : i + self.max_ids_per_request]
+            for i in range(0, len(distinct_ids), self.max_ids_per_request)
+        ]
+        works_by_id = {}
+        for works in self._executor.map(self._get_works_chunk, chunks):
+            works_by_id.update((work.id, work) for work in works)
+
+        missing_ids = [work_id for work_id in distinct_ids if work_id not in works_by_id]
+        if missing_ids:
+            logger.warning(f"OpenAlex returned no works for {len(missing_ids)} ids: {missing_ids}")
+        return [works_by_id[work_id] for work_id in openalex_ids if work_id in works_by_id], missing_ids
+
+    def _get_works_chunk(self, openalex_ids: list[int]) -> list[Work]:
+        response = self.get(
+            "works",
+            {
+                "filter": "openalex:" + "|".join(f"W{work_id}" for work_id in openalex_ids),
+                "per-page": self.max_ids_per_request,
+            },
+        )
+        return [Work(pyalex.Work(result)) for result in response["results"]]
+
+    def close(self):
+        self._executor.shutdown()
+        self.session.close()
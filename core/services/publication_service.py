@@ -1,21 +1,38 @@
+import asyncio
 import datetime
+import hashlib
+import json
 import logging
+import math
+import threading
+import time
+from collections.abc import Iterator
 from enum import Enum
-from itertools import chain
+from functools import partial
 from os import environ
 
 import pyalex
 
-from core.dataclasses.data_classes import Work, ScoredWork
-from core.llm_interfaces import LLMInterface
-from core.repositories.publication_repository import PublicationRepository
+from core.dataclasses.data_classes import Work, ScoredWork, QueryContext, CandidateSet
+from core.llm_interfaces import LLMInterface, AsyncLLMInterface
+from core.repositories.harvest_checkpoint_repository import HarvestCheckpointRepository
+from core.repositories.publication_repository import PublicationRepository, ScoreFusion
+from core.repositories.sync_state_repository import SyncStateRepository
 from core.repositories.topic_repository import TopicRepository
+from core.services.candidate_pruning import MMRPruner
+from core.services.ingestion_pipeline import IngestionPipeline, StageMetrics
+from core.services.openalex_client import OpenAlexClient, WorksPage
+from core.services.reranking_service import RerankingService
 from core.sqlalchemy_models.openalex.topic import Topic
 
 # from core.services.user_service import UserService
 
 logger = logging.getLogger(__name__)
 pyalex.config.email = environ.get("OPENALEX_CONTACT_EMAIL")
+# shared by all requests, so that connections are reused
+openalex_client = OpenAlexClient()
+# OpenAlex accepts at most 100 values OR'd in a single filter
+MAX_TOPICS_PER_HARVEST = 100
 
 
 def _normalize_scores(scores: list[float]) -> list[float]:
@@ -27,6 +44,43 @@ def _normalize_scores(scores: list[float]) -> list[float]:
     return [(score - min_score) / (max_score - min_score) for score in scores]
 
 
+def _harvest_key(topic_ids: list[int], start_date: datetime.date, limit: int) -> str:
+    # identifies a harvest by its parameters, so that an interrupted harvest can be resumed
+    parameters = json.dumps({"topics": sorted(topic_ids), "start_date": start_date.isoformat(), "limit": limit})
+    return hashlib.sha256(parameters.encode("utf-8")).hexdigest()
+
+
+def _as_query_context(query: str | QueryContext) -> QueryContext:
+    return query if isinstance(query, QueryContext) else QueryContext(query)
+
+
+def _log_stage(stage: str, num_works: int, start: float):
+    logger.info(f"Stage {stage}: {num_works} works in {time.perf_counter() - start:.2f}s")
+
+
+def _to_metadata_row(work: Work) -> dict:
+    # row for PublicationRepository.update_metadata, the metadata needed to serve a work from the database
+    return {
+        "openalex_id": work.id,
+        "topics": work.topics,
+        "cited_by_count": work.cited_by_count,
+        "created_datetime_utc": work.created_date,
+    }
+
+
+def _to_publication_row(work: Work, embedding: list[float], accessed: datetime.datetime) -> dict:
+    # row for PublicationRepository.bulk_create
+    return {
+        **_to_metadata_row(work),
+        "title": work.title,
+        "authors": work.authors,
+        "abstract": work.abstract,
+        "publication_datetime_utc": work.publication_date,
+        "accessed_datetime_utc": accessed,
+        "embedding": embedding,
+    }
+
+
 class SearchType(Enum):
     SEMANTIC = "semantic"
     BM25 = "bm25"
@@ -39,33 +93,56 @@ def get_work_by_openalex_id(openalex_id: str) -> Work:
 
 
 def get_works_by_openalex_ids(openalex_ids: list[str] | list[int]) -> list[Work]:
+    """
+    Fetch works from OpenAlex, in the order of the ids. Ids OpenAlex returns no work for are logged and skipped, use
+    openalex_client.get_works_by_ids to obtain them.
+    """
     if not openalex_ids:
         return []
-    # copy list to avoid modifying the original list
-    ids = list(openalex_ids)
-    # if the ids are integers, convert them to the OpenAlex format by prepending "W"
-    if isinstance(ids[0], int):
-        ids = [f"W{str(work_id)}" for work_id in openalex_ids]
-
-    works = []
-    # OpenAlex API only allows 100 ids per query
-    for i in range(0, len(ids), 100):
-        query = pyalex.Works().filter(openalex="|".join(ids[i : i + 100]))
-        for pyalex_work in chain(*query.paginate(per_page=200, n_max=None)):
-            works.append(Work(pyalex_work))
-
-    # because the API returns works in an arbitrary order, we need to restore the original order
-    works = sorted(works, key=lambda work: openalex_ids.index(work.id))
+    # if the ids are strings in the OpenAlex format ("W12345"), convert them to integers
+    ids = [int(str(work_id).split("W")[-1]) for work_id in openalex_ids]
+    works, _ = openalex_client.get_works_by_ids(ids)
     return works
 
 
 def get_works_by_topics(
     topic_ids: [int], published_after: datetime.date, require_abstract=True, n_max: int = 2000, most_recent_first=True
 ) -> list[Work]:
+    works = []
+    work_ids = {}
+    for page in harvest_works_by_topics(topic_ids, published_after, require_abstract, n_max, most_recent_first):
+        for work in page.works:
+            # OpenAlex sometimes returns the same work multiple times, so we need to deduplicate
+            if work.id not in work_ids:
+                work_ids[work.id] = True
+                works.append(work)
+
+    logger.info(f"Found {len(works)} works.")
+
+    return works
+
+
+def harvest_works_by_topics(
+    topic_ids: [int],
+    published_after: datetime.date,
+    require_abstract=True,
+    n_max: int = 2000,
+    most_recent_first=True,
+    cursor: str = "*",
+    published_before: datetime.date = None,
+) -> Iterator[WorksPage]:
+    """
+    Streaming variant of get_works_by_topics: yields the works page by page, so that they can be processed before
+    the next page is fetched. Pages are not deduplicated.
+
+    Parameters:
+        cursor: Cursor to resume at (WorksPage.next_cursor of the last processed page), "*" to start from the beginning.
+        published_before: End of the publication date window, defaults to today. Resuming requires the same window.
+    """
     topic_filter_str = "|".join(f"T{str(topic_id)}" for topic_id in topic_ids)
     # ISO 8601 date format
     from_publication_date_str = published_after.strftime("%Y-%m-%d")
-    to_publication_date_str = datetime.datetime.now().strftime("%Y-%m-%d")
+    to_publication_date_str = (published_before or datetime.datetime.now()).strftime("%Y-%m-%d")
 
     no_limit = n_max == -1
 
@@ -85,17 +162,7 @@ def get_works_by_topics(
         f"Querying OpenAlex for works with topics {topic_ids} published after {published_after} (n_max={n_max if not no_limit else "unlimited"}) Query URL: {query.url}"
     )
 
-    works = []
-    work_ids = {}
-    for pyalex_work in chain(*query.paginate(per_page=200, n_max=(n_max if not no_limit else None))):
-        # OpenAlex sometimes returns the same work multiple times, so we need to deduplicate
-        if pyalex_work["id"] not in work_ids:
-            work_ids[pyalex_work["id"]] = True
-            works.append(Work(pyalex_work))
-
-    logger.info(f"Found {len(works)} works.")
-
-    return works
+    yield from openalex_client.iter_works_pages(query, cursor, per_page=200, n_max=(n_max if not no_limit else None))
 
 
 def compute_relevance_scores_by_topics(
@@ -124,172 +191,641 @@ def compute_relevance_scores_by_topics(
     return scored_works
 
 
+class _IngestionBatch:
+    # works harvested for initialize_for_query that are not stored yet, with the harvest progress after the batch
+    def __init__(
+        self,
+        harvest: "_TopicHarvest",
+        works: list[Work],
+        next_cursor: str | None,
+        works_harvested: int,
+        harvested_works: list[Work],
+    ):
+        self.harvest = harvest
+        self.works = works
+        self.next_cursor = next_cursor
+        self.works_harvested = works_harvested
+        self.last_work_id = harvested_works[-1].id if harvested_works else None
+        # newest of all harvested works, including the ones that were already stored
+        self.latest_publication_date = max((work.publication_date for work in harvested_works), default=None)
+        self.latest_created_date = max((work.created_date for work in harvested_works), default=None)
+
+
+class _IngestionProgress:
+    # accumulated over the written batches of initialize_for_query
+    def __init__(self):
+        self.added_work_ids: list[int] = []
+        self.latest_publication_date: datetime.datetime | None = None
+        self.latest_created_date: datetime.datetime | None = None
+
+    def add(self, batch: _IngestionBatch):
+        self.added_work_ids.extend(work.id for work in batch.works)
+        if self.latest_publication_date is None or (
+            batch.latest_publication_date is not None and batch.latest_publication_date > self.latest_publication_date
+        ):
+            self.latest_publication_date = batch.latest_publication_date
+        if self.latest_created_date is None or (
+            batch.latest_created_date is not None and batch.latest_created_date > self.latest_created_date
+        ):
+            self.latest_created_date = batch.latest_created_date
+
+
+class _TopicHarvest:
+    # harvest of the works of a topic set, resumed from its checkpoint if there is one
+    def __init__(
+        self,
+        topic_ids: list[int],
+        start_date: datetime.datetime,
+        key: str,
+        cursor: str,
+        published_before: datetime.date,
+        works_harvested: int,
+    ):
+        self.topic_ids = topic_ids
+        self.start_date = start_date
+        self.key = key
+        self.cursor = cursor
+        self.published_before = published_before
+        self.works_harvested = works_harvested
+        self.progress = _IngestionProgress()
+
+
+def _refresh_start_date(
+    start_date: datetime.date, latest_publication_date: datetime.date, overlap_days: int
+) -> datetime.date:
+    # start of the window to query when refreshing, never before start_date, of the same type as start_date
+    since = latest_publication_date - datetime.timedelta(days=overlap_days)
+    if isinstance(start_date, datetime.datetime):
+        if since <= start_date.date():
+            return start_date
+        return datetime.datetime.combine(since, datetime.time.min, tzinfo=start_date.tzinfo)
+    return max(since, start_date)
+
+
 class PublicationService:
     def __init__(
         self,
         publication_repository: PublicationRepository,
         topic_repository: TopicRepository,
         llm_interface: LLMInterface,
+        async_llm_interface: AsyncLLMInterface = None,
+        checkpoint_repository: HarvestCheckpointRepository = None,
+        sync_state_repository: SyncStateRepository = None,
+        reranking_service: RerankingService = None,
+        pruner: MMRPruner = None,
     ):
         self.publication_repository = publication_repository
         self.topic_repository = topic_repository
+        # checkpoints and sync states are committed together with the publications, so they have to share the session
+        if checkpoint_repository is None:
+            checkpoint_repository = HarvestCheckpointRepository(publication_repository.session)
+        self.checkpoint_repository = checkpoint_repository
+        if sync_state_repository is None:
+            sync_state_repository = SyncStateRepository(publication_repository.session)
+        self.sync_state_repository = sync_state_repository
         # self.user_service = user_service
         self.llm_interface = llm_interface
+        self.async_llm_interface = async_llm_interface
+        if reranking_service is None:
+            reranking_service = RerankingService(llm_interface, async_llm_interface=async_llm_interface)
+        self.reranking_service = reranking_service
+        self.pruner = pruner if pruner is not None else MMRPruner()
+        # the repositories share a single (non thread-safe) session, so database access from worker threads is serialized
+        self._session_lock = threading.Lock()
+        # per-stage throughput of the last initialize_for_query
+        self.ingestion_metrics: dict[str, StageMetrics] = {}
+
+    def create_query_context(self, query: str) -> QueryContext:
+        """
+        Create a context for a single user request. Passing the context instead of the query string to
+        initialize_for_query and get_relevant_works_for_query lets them share derived artifacts, e.g. the query
+        embedding is only computed once.
+        """
+        return QueryContext(query)
 
     # Fetches all potentially relevant works for a user published after a certain date, embeds the abstracts and stores them in the database
     # Does not yet score publications
     def initialize_for_query(
-        self, query: str, start_date: datetime.datetime, limit: int = -1, num_topics: int = 5
-    ) -> tuple[list[Topic], list[Work]]:
-        topics = self._get_matching_topics_for_query(query, num_topics)
+        self,
+        query: str | QueryContext,
+        start_date: datetime.datetime,
+        limit: int = -1,
+        num_topics: int = 5,
+        batch_size: int = 2000,
+        embedding_concurrency: int = 2,
+        refresh: bool = False,
+        refresh_overlap_days: int = 7,
+    ) -> tuple[list[Topic], list[int]]:
+        """
+        Works are harvested from OpenAlex page by page and embedded and stored in batches of batch_size. Harvesting,
+        embedding (of up to embedding_concurrency batches at once) and writing overlap, see IngestionPipeline. Memory
+        usage is bounded by the few batches in flight, the stage metrics of the last run are kept in ingestion_metrics.
+        Every batch is committed together with a checkpoint of the harvest. If the initialization is interrupted,
+        calling it again with the same parameters resumes after the last committed batch.
+
+        The newest publication date harvested for the matching topic set is stored as a watermark. With refresh=True,
+        only works published since the watermark are queried, e.g. for a daily update. OpenAlex adds works with past
+        publication dates with some delay, so the window starts refresh_overlap_days before the watermark.
+
+        Returns:
+            tuple[list[Topic], list[int]]: The matching topics and the ids of the works that were added.
+        """
+        context = _as_query_context(query)
+        topics = self._get_matching_topics_for_query(context, num_topics)
         topic_ids = [topic.id for topic in topics]
 
-        works = get_works_by_topics(topic_ids, start_date, require_abstract=True, n_max=limit)
-        access_timestamp = datetime.datetime.now()
+        added_work_ids = self._ingest_topics(
+            topic_ids, start_date, limit, batch_size, embedding_concurrency, refresh, refresh_overlap_days
+        )
 
-        # skip works that have already been embedded
-        known_works = self.publication_repository.get_all_openalex_ids()
-        works_to_be_added = [work for work in works if work.id not in known_works]
+        # only vectorizes the new works, unless the corpus statistics drifted too far
+        self.publication_repository.update_bm25()
+        logger.info(f"Finished initialization. Added {len(added_work_ids)} works.")
+        return topics, added_work_ids
 
+    def initialize_for_queries(
+        self,
+        queries: list[str | QueryContext],
+        start_date: datetime.datetime,
+        limit: int = -1,
+        num_topics: int = 5,
+        batch_size: int = 2000,
+        embedding_concurrency: int = 2,
+        refresh: bool = False,
+        refresh_overlap_days: int = 7,
+    ) -> tuple[list[list[Topic]], list[int]]:
+        """
+        Initialize many queries at once, e.g. the research interests of all users. Queries are embedded in a single
+        batch and matched to topics in a single database query. The union of the matching topics is harvested once,
+        through a single ingestion pipeline, so OpenAlex traffic grows with the number of distinct topics instead of
+        the number of queries. The parameters are the same as in initialize_for_query, limit caps the number of works
+        harvested for the union.
+
+        The union is harvested in topic sets of up to MAX_TOPICS_PER_HARVEST topics, the most OpenAlex accepts in a
+        single filter. The limit is split across the topic sets in proportion to their number of topics, and every
+        topic set harvests its most recent works within its share; the part of a share a topic set does not use (it
+        has fewer works) is passed on to the following ones. Checkpoints and refresh watermarks are kept per topic set,
+        so they are shared with initialize_for_query for the same topic set, e.g. if the union has at most
+        MAX_TOPICS_PER_HARVEST topics and equals the topics matched for a single query.
+
+        Returns:
+            tuple[list[list[Topic]], list[int]]: The matching topics of each query and the ids of the works that were
+                added.
+        """
+        contexts = [_as_query_context(query) for query in queries]
+        not_embedded = [context for context in contexts if context.embedding is None]
+        if not_embedded:
+            embeddings = self.llm_interface.create_embedding_batch(
+                [context.normalized_query for context in not_embedded]
+            )
+            for context, embedding in zip(not_embedded, embeddings):
+                context.embedding = embedding
+        topics_per_query = [
+            topics
+            for topics, _ in self.topic_repository.get_topics_by_embedding_similarity_batch(
+                [context.embedding for context in contexts], num_topics
+            )
+        ]
+
+        topic_ids = list(dict.fromkeys(topic.id for topics in topics_per_query for topic in topics))
         logger.info(
-            f"Embedding {len(works_to_be_added)} works. {len(works) - len(works_to_be_added)} works were already present."
+            f"{len(contexts)} queries match {len(topic_ids)} distinct topics "
+            f"({sum(len(topics) for topics in topics_per_query)} in total)."
+        )
+        added_work_ids = self._ingest_topics(
+            topic_ids, start_date, limit, batch_size, embedding_concurrency, refresh, refresh_overlap_days
         )
-        # embed abstracts
-        abstracts = []
-        for work in works_to_be_added:
-            if work.abstract:
-                abstracts.append(work.abstract)
-            else:
-                raise ValueError(f"Work {work} has no abstract, but the abstract is required for embedding.")
 
-        works_processed = 0
-        for i in range(0, len(works_to_be_added), 2000):
-            embeddings = self.llm_interface.create_embedding_batch(abstracts[i : i + 2000])
-            for work, embedding in zip(works_to_be_added[i : i + 2000], embeddings):
-                # TODO: Consistent naming? Work or Publication?
-                self.publication_repository.create(
-                    openalex_id=work.id,
-                    title=work.title,
-                    authors=work.authors,
-                    abstract=work.abstract,
-                    published=work.publication_date,
-                    accessed=access_timestamp,
-                    embedding=embedding,
+        self.publication_repository.update_bm25()
+        logger.info(f"Finished initialization of {len(contexts)} queries. Added {len(added_work_ids)} works.")
+        return topics_per_query, added_work_ids
+
+    def _ingest_topics(
+        self,
+        topic_ids: list[int],
+        start_date: datetime.datetime,
+        limit: int,
+        batch_size: int,
+        embedding_concurrency: int,
+        refresh: bool,
+        refresh_overlap_days: int,
+    ) -> list[int]:
+        """
+        Harvest, embed and store the works of the topics, see initialize_for_query. Topic sets of more than
+        MAX_TOPICS_PER_HARVEST topics are harvested one chunk after the other, through a single pipeline, and limit caps
+        the number of works harvested for all of them, see initialize_for_queries. Does not update BM25 vectors.
+        Returns the ids of the added works.
+        """
+        topic_ids = sorted(set(topic_ids))
+        harvests = [
+            self._topic_harvest(
+                topic_ids[i : i + MAX_TOPICS_PER_HARVEST], start_date, limit, refresh, refresh_overlap_days
+            )
+            for i in range(0, len(topic_ids), MAX_TOPICS_PER_HARVEST)
+        ]
+
+        # ids of works that are harvested but not written yet, so that they are not embedded twice
+        pending_ids = set()
+        pipeline = IngestionPipeline(
+            harvest=partial(self._harvest_batches, harvests, batch_size, limit, pending_ids),
+            embed=self._embed_batch,
+            write=partial(self._write_batch, pending_ids),
+            batch_size=lambda batch: len(batch.works),
+            embedding_workers=embedding_concurrency,
+        )
+        self.ingestion_metrics = pipeline.run()
+        for harvest in harvests:
+            self.checkpoint_repository.delete(harvest.key)
+            progress = harvest.progress
+            if progress.latest_publication_date is not None:
+                self.sync_state_repository.advance(
+                    harvest.topic_ids,
+                    progress.latest_publication_date.date(),
+                    progress.latest_created_date.date() if progress.latest_created_date is not None else None,
                 )
-            self.publication_repository.commit()
-            works_processed += len(embeddings)
-            logger.info(f"Progress: {works_processed} out of {len(works_to_be_added)} works embedded.")
+        self.publication_repository.commit()
+        return [work_id for harvest in harvests for work_id in harvest.progress.added_work_ids]
 
-        self.publication_repository.rebuild_bm25()
-        logger.info(f"Finished initialization. Added {len(works_to_be_added)} works.")
-        return topics, works_to_be_added
+    def _topic_harvest(
+        self,
+        topic_ids: list[int],
+        start_date: datetime.datetime,
+        limit: int,
+        refresh: bool,
+        refresh_overlap_days: int,
+    ) -> _TopicHarvest:
+        sync_state = self.sync_state_repository.get(topic_ids)
+        if refresh and sync_state is not None:
+            start_date = _refresh_start_date(start_date, sync_state.latest_publication_date, refresh_overlap_days)
+            logger.info(f"Refreshing works of topics {topic_ids} published since {start_date:%Y-%m-%d}.")
+
+        key = _harvest_key(topic_ids, start_date, limit)
+        checkpoint = self.checkpoint_repository.get(key)
+        if checkpoint is None:
+            return _TopicHarvest(topic_ids, start_date, key, "*", datetime.date.today(), 0)
+        logger.info(
+            f"Resuming harvest of topics {topic_ids} after {checkpoint.works_harvested} works "
+            f"(last work: {checkpoint.last_work_id})."
+        )
+        return _TopicHarvest(
+            topic_ids,
+            start_date,
+            key,
+            checkpoint.next_cursor,
+            checkpoint.to_publication_date,
+            checkpoint.works_harvested,
+        )
+
+    def _harvest_batches(
+        self, harvests: list[_TopicHarvest], batch_size: int, limit: int, pending_ids: set[int]
+    ) -> Iterator[_IngestionBatch]:
+        # groups the harvested pages into batches of the works that are not stored yet, runs in the harvest thread
+        # the part of the limit that is not used by the previous topic sets, and the topics it is shared by
+        remaining_limit = limit
+        remaining_topics = sum(len(harvest.topic_ids) for harvest in harvests)
+        for harvest in harvests:
+            works_harvested = harvest.works_harvested
+            remaining = -1
+            if limit != -1:
+                share = math.ceil(remaining_limit * len(harvest.topic_ids) / remaining_topics)
+                remaining_topics -= len(harvest.topic_ids)
+                remaining = share - works_harvested
+                if remaining <= 0:
+                    remaining_limit -= works_harvested
+                    continue
+            pages = harvest_works_by_topics(
+                harvest.topic_ids,
+                harvest.start_date,
+                n_max=remaining,
+                cursor=harvest.cursor,
+                published_before=harvest.published_before,
+            )
+            works = []
+            for page in pages:
+                works.extend(page.works)
+                works_harvested += len(page.works)
+                if len(works) >= batch_size or page.next_cursor is None:
+                    yield self._with_session_lock(
+                        self._new_works_batch, harvest, works, page.next_cursor, works_harvested, pending_ids
+                    )
+                    works = []
+            if works:
+                # the harvest ended on a full page (n_max reached)
+                yield self._with_session_lock(self._new_works_batch, harvest, works, None, works_harvested, pending_ids)
+            if limit != -1:
+                remaining_limit -= works_harvested
+
+    def _new_works_batch(
+        self,
+        harvest: _TopicHarvest,
+        works: list[Work],
+        next_cursor: str | None,
+        works_harvested: int,
+        pending_ids: set[int],
+    ) -> _IngestionBatch:
+        # skip works that have already been embedded, also deduplicates works returned multiple times by OpenAlex
+        missing_ids = set(self.publication_repository.get_missing_openalex_ids([work.id for work in works]))
+        new_works = list({work.id: work for work in works if work.id in missing_ids - pending_ids}.values())
+        pending_ids.update(work.id for work in new_works)
+        for work in new_works:
+            if not work.abstract:
+                raise ValueError(f"Work {work} has no abstract, but the abstract is required for embedding.")
+        logger.info(f"Embedding {len(new_works)} works. {len(works) - len(new_works)} works were already present.")
+        return _IngestionBatch(harvest, new_works, next_cursor, works_harvested, works)
+
+    def _embed_batch(self, batch: _IngestionBatch) -> list[list[float]]:
+        # runs in the embedding threads
+        if not batch.works:
+            return []
+        return self.llm_interface.create_embedding_batch([work.abstract for work in batch.works])
+
+    def _write_batch(self, pending_ids: set[int], batch: _IngestionBatch, embeddings: list[list[float]]):
+        with self._session_lock:
+            access_timestamp = datetime.datetime.now(datetime.timezone.utc)
+            # TODO: Consistent naming? Work or Publication?
+            self.publication_repository.bulk_create(
+                [
+                    _to_publication_row(work, embedding, access_timestamp)
+                    for work, embedding in zip(batch.works, embeddings)
+                ]
+            )
+            if batch.next_cursor is not None:
+                self.checkpoint_repository.save(
+                    batch.harvest.key,
+                    batch.next_cursor,
+                    batch.harvest.published_before,
+                    batch.works_harvested,
+                    batch.last_work_id,
+                )
+            # the checkpoint is committed together with the works
+            self.publication_repository.commit()
+            pending_ids.difference_update(work.id for work in batch.works)
+        progress = batch.harvest.progress
+        progress.add(batch)
+        logger.info(f"Progress: {batch.works_harvested} works harvested, {len(progress.added_work_ids)} works added.")
 
     def get_relevant_works_for_query(
         self,
-        query: str,
+        query: str | QueryContext,
         n: int,
         start_date: datetime.datetime,
         search_type: SearchType = SearchType.HYBRID,
         rerank: bool = True,
+        fusion: ScoreFusion = ScoreFusion.LINEAR,
+        prune: bool = True,
     ) -> list[Work]:
+        """
+        Retrieve the n most relevant works for the query. With rerank=True, n * 10 candidates are retrieved and
+        reranked by an LLM. With prune=True, the candidates are first pruned to an adaptive pool with MMR on their
+        stored embeddings (see MMRPruner), so that fewer candidates are sent to the LLM. The latency of each stage is
+        logged. See get_relevant_candidates_for_query to obtain the scores of the works as well.
+        """
+        return list(self.get_relevant_candidates_for_query(query, n, start_date, search_type, rerank, fusion, prune))
+
+    def get_relevant_candidates_for_query(
+        self,
+        query: str | QueryContext,
+        n: int,
+        start_date: datetime.datetime,
+        search_type: SearchType = SearchType.HYBRID,
+        rerank: bool = True,
+        fusion: ScoreFusion = ScoreFusion.LINEAR,
+        prune: bool = True,
+    ) -> CandidateSet:
+        """
+        Like get_relevant_works_for_query, but returns the candidate set shared by the retrieval stages, including the
+        retrieval scores of the works. The set can be passed on to e.g. SummarizationService.summarize_works_for_query.
+        """
         # if reranking is enabled, fetch more candidate publications so that reranking can push up
         # publications missed by bm25/embedding retrieval
         n_initial = n * 10 if rerank else n
+        context = _as_query_context(query)
 
         print(f"Getting top {n} publications using {search_type} search. Reranking enabled: {rerank}")
+        start = time.perf_counter()
+        work_ids, scores = self._search(context, n_initial, start_date, search_type, fusion)
+        candidates = CandidateSet(work_ids, {"retrieval": scores})
+        _log_stage("retrieval", len(candidates), start)
+
+        # now "hydrate" the works, from the database where possible
+        start = time.perf_counter()
+        candidates = self._hydrate(candidates)
+        _log_stage("hydration", len(candidates), start)
+
+        if rerank and prune:
+            start = time.perf_counter()
+            candidates = self._prune(self._query_embedding(context), candidates, n)
+            _log_stage("pruning", len(candidates), start)
+
+        if rerank:
+            print(f"Reranking to identify top {n} among {len(candidates)} publications.")
+            start = time.perf_counter()
+            candidates = self._rerank(context.query, candidates, k=n)
+            _log_stage("reranking", len(candidates), start)
+
+        return candidates
+
+    async def get_relevant_works_for_query_async(
+        self,
+        query: str | QueryContext,
+        n: int,
+        start_date: datetime.datetime,
+        search_type: SearchType = SearchType.HYBRID,
+        rerank: bool = True,
+        fusion: ScoreFusion = ScoreFusion.LINEAR,
+        prune: bool = True,
+    ) -> list[Work]:
+        """
+        Asynchronous variant of get_relevant_works_for_query, allowing a single event loop to serve many requests.
+        The query embedding and the reranking comparisons are requested via the async LLM interface (see
+        RerankingService.rerank_async), blocking database and OpenAlex calls are offloaded to worker threads. Database
+        access is serialized, because the repositories share one session, OpenAlex requests do not hold the lock.
+        """
+        return list(
+            await self.get_relevant_candidates_for_query_async(query, n, start_date, search_type, rerank, fusion, prune)
+        )
+
+    async def get_relevant_candidates_for_query_async(
+        self,
+        query: str | QueryContext,
+        n: int,
+        start_date: datetime.datetime,
+        search_type: SearchType = SearchType.HYBRID,
+        rerank: bool = True,
+        fusion: ScoreFusion = ScoreFusion.LINEAR,
+        prune: bool = True,
+    ) -> CandidateSet:
+        """
+        Asynchronous variant of get_relevant_candidates_for_query, see get_relevant_works_for_query_async.
+        """
+        if self.async_llm_interface is None:
+            raise ValueError("An AsyncLLMInterface is required for asynchronous retrieval.")
+
+        n_initial = n * 10 if rerank else n
+        context = _as_query_context(query)
+
+        logger.info(f"Getting top {n} publications using {search_type} search. Reranking enabled: {rerank}")
+        needs_embedding = search_type in (SearchType.SEMANTIC, SearchType.HYBRID) or (rerank and prune)
+        if needs_embedding and context.embedding is None:
+            context.embedding = await self.async_llm_interface.create_embedding(context.normalized_query)
+        start = time.perf_counter()
+        work_ids, scores = await asyncio.to_thread(
+            self._with_session_lock, self._search, context, n_initial, start_date, search_type, fusion
+        )
+        candidates = CandidateSet(work_ids, {"retrieval": scores})
+        _log_stage("retrieval", len(candidates), start)
+
+        start = time.perf_counter()
+        missing_ids = await asyncio.to_thread(self._with_session_lock, self._add_stored_works, candidates)
+        if missing_ids:
+            # fetched without holding the session lock, so that a slow request does not stall other requests
+            fetched_works = await asyncio.to_thread(self._fetch_missing_works, missing_ids)
+            await asyncio.to_thread(self._with_session_lock, self._add_fetched_works, candidates, fetched_works)
+        candidates = candidates.hydrated()
+        _log_stage("hydration", len(candidates), start)
+
+        if rerank and prune:
+            start = time.perf_counter()
+            candidates = await asyncio.to_thread(self._with_session_lock, self._prune, context.embedding, candidates, n)
+            _log_stage("pruning", len(candidates), start)
+
+        if rerank:
+            logger.info(f"Reranking to identify top {n} among {len(candidates)} publications.")
+            start = time.perf_counter()
+            reranked = await self.reranking_service.rerank_async(context.query, candidates, n)
+            candidates = candidates.select(work.id for work in reranked)
+            _log_stage("reranking", len(candidates), start)
+
+        return candidates
+
+    def hydrate_works(self, work_ids: list[int]) -> list[Work]:
+        """
+        Returns the works with the given ids, in the given order. Works are built from the stored publications, only
+        works stored without OpenAlex metadata (ingested before it was persisted) are fetched from the OpenAlex API.
+        Their metadata is stored, so that they are served from the database next time.
+        """
+        return list(self._hydrate(CandidateSet(work_ids)))
+
+    def _hydrate(self, candidates: CandidateSet) -> CandidateSet:
+        # adds the works of the candidates to the set, see hydrate_works. Returns the candidates with works.
+        missing_ids = self._add_stored_works(candidates)
+        if missing_ids:
+            self._add_fetched_works(candidates, self._fetch_missing_works(missing_ids))
+        return candidates.hydrated()
+
+    def _add_stored_works(self, candidates: CandidateSet) -> list[int]:
+        # adds the works stored with metadata to the set, returns the ids of the other candidates
+        candidates.add_works(
+            Work.from_publication(publication)
+            for publication in self.publication_repository.get_by_openalex_ids(candidates.ids)
+            if publication.topics is not None
+        )
+        return [work_id for work_id in candidates.ids if work_id not in candidates.works]
+
+    @staticmethod
+    def _fetch_missing_works(missing_ids: list[int]) -> list[Work]:
+        logger.info(f"Fetching {len(missing_ids)} works without stored metadata from OpenAlex.")
+        return get_works_by_openalex_ids(missing_ids)
+
+    def _add_fetched_works(self, candidates: CandidateSet, fetched_works: list[Work]):
+        # stores the metadata of the fetched works, so that they are served from the database next time
+        self.publication_repository.update_metadata([_to_metadata_row(work) for work in fetched_works])
+        self.publication_repository.commit()
+        candidates.add_works(fetched_works)
+
+    def _with_session_lock(self, func, *args, **kwargs):
+        with self._session_lock:
+            return func(*args, **kwargs)
+
+    def _search(
+        self,
+        context: QueryContext,
+        n: int,
+        start_date: datetime.datetime,
+        search_type: SearchType,
+        fusion: ScoreFusion = ScoreFusion.LINEAR,
+    ) -> tuple[list[int], list[float]]:
         if search_type == SearchType.SEMANTIC:
-            work_ids, scores = self._semantic_search(query, n_initial, start_date, normalize=True)
+            return self._semantic_search(context, n, start_date, normalize=True)
         elif search_type == SearchType.BM25:
-            work_ids, scores = self._bm25_search(query, n_initial, start_date, normalize=True)
+            return self._bm25_search(context, n, start_date, normalize=True)
         elif search_type == SearchType.HYBRID:
-            work_ids, scores = self._hybrid_search(query, n_initial, start_date, normalize=True)
+            return self._hybrid_search(context, n, start_date, normalize=True, fusion=fusion)
         else:
             raise ValueError(f"Invalid search type {search_type}")
 
-        # now "hydrate" the works via the OpenAlex API
-        works = get_works_by_openalex_ids(work_ids)
+    def _query_embedding(self, context: QueryContext) -> list[float]:
+        if context.embedding is None:
+            context.embedding = self.llm_interface.create_embedding(context.normalized_query)
+        return context.embedding
 
-        if rerank:
-            print(f"Reranking to identify top {n} among {len(work_ids)} publications.")
-            works = self._rerank(query, works, k=n)
-
-        return works
+    def _bm25_query_vector(self, context: QueryContext) -> str:
+        if context.bm25_query_vector is None:
+            context.bm25_query_vector = self.publication_repository.get_bm25_query_vector(context.normalized_query)
+        return context.bm25_query_vector
 
-    def _get_matching_topics_for_query(self, query: str, n_topics: int) -> list[Topic]:
-        query_embedding = self.llm_interface.create_embedding(query)
-        topics, _ = self.topic_repository.get_topics_by_embedding_similarity(query_embedding, top_n=n_topics)
+    def _get_matching_topics_for_query(self, context: QueryContext, n_topics: int) -> list[Topic]:
+        topics, _ = self.topic_repository.get_topics_by_embedding_similarity(
+            self._query_embedding(context), top_n=n_topics
+        )
         return topics
 
     def _semantic_search(
-        self, query: str, n: int, start_date: datetime.datetime, normalize: bool = False
+        self, context: QueryContext, n: int, start_date: datetime.datetime, normalize: bool = False
     ) -> tuple[list[int], list[float]]:
-        query_embedding = self.llm_interface.create_embedding(query)
         work_ids, scores = self.publication_repository.get_openalex_ids_by_embedding_similarity(
-            query_embedding, n, start_date
+            self._query_embedding(context), n, start_date
         )
         if normalize:
             scores = _normalize_scores(scores)
         return work_ids, scores
 
     def _bm25_search(
-        self, query: str, n: int, start_date: datetime.datetime, normalize: bool = False
+        self, context: QueryContext, n: int, start_date: datetime.datetime, normalize: bool = False
     ) -> tuple[list[int], list[float]]:
-        work_ids, scores = self.publication_repository.get_openalex_ids_by_bm25_similarity(query, n, start_date)
+        work_ids, scores = self.publication_repository.get_openalex_ids_by_bm25_similarity(
+            context.normalized_query, n, start_date, query_vector=self._bm25_query_vector(context)
+        )
         if normalize:
             scores = _normalize_scores(scores)
         return work_ids, scores
 
     def _hybrid_search(
         self,
-        query: str,
+        context: QueryContext,
         n: int,
         start_date: datetime.datetime,
         normalize: bool = False,
         weights: tuple[float, float] = (0.8, 0.2),
+        fusion: ScoreFusion = ScoreFusion.LINEAR,
     ) -> tuple[list[int], list[float]]:
-        work_ids_semantic, scores_semantic = self._semantic_search(query, n * 2, start_date, normalize)
-        work_ids_bm25, scores_bm25 = self._bm25_search(query, n * 2, start_date, normalize)
-
-        # scale by weight of retrieval method
-        scores_semantic = [weights[0] * score for score in scores_semantic]
-        scores_bm25 = [weights[1] * score for score in scores_bm25]
-        # combine scores
-        merged_works = {}  # deduplicate
-        for work, score in zip(chain(work_ids_semantic, work_ids_bm25), chain(scores_semantic, scores_bm25)):
-            if work not in merged_works:
-                merged_works[work] = score
-            else:
-                merged_works[work] += score
-        # get n highest scored works with their scores
-        merged_works = sorted(merged_works.items(), key=lambda x: x[1], reverse=True)[:n]
-
-        return [work_id for work_id, _ in merged_works], [score for _, score in merged_works]
-
-    def _rerank(self, query: str, works: list[Work | ScoredWork], k: int = 10) -> list[Work]:
-        from llmrankers.setwise import OpenAiSetwiseLlmRanker
-        from llmrankers.rankers import SearchResult
-
-        if isinstance(works[0], ScoredWork):
-            works = [scored_work.work for scored_work in works]
-
-        # check if the works have abstracts
-        if not all(work.abstract for work in works):
-            raise ValueError("All works must have abstracts for reranking.")
-
-        reranker = OpenAiSetwiseLlmRanker(
-            model_name_or_path="gpt-4o-mini-2024-07-18",
-            api_key=environ.get("OPENAI_API_KEY"),
-            method="heapsort",
-            num_child=2,
-            k=k,
+        # retrieval of n * 2 candidates per method and merging happen in a single query
+        # the BM25 query vector is computed within that query, unless it is already known
+        return self.publication_repository.get_openalex_ids_by_hybrid_similarity(
+            self._query_embedding(context),
+            context.normalized_query,
+            n,
+            start_date,
+            query_vector=context.bm25_query_vector,
+            candidates_per_method=n * 2,
+            weights=weights,
+            fusion=fusion,
+            normalize=normalize,
         )
 
-        docs = [SearchResult(docid=work.id, text=work.abstract, score=None) for work in works]
-        reranked_docs, _ = reranker.rerank(query, docs)
-
-        # we need to get the original Work objects back via docid
-        reranked_works = []
-        for doc in reranked_docs:
-            reranked_works.extend([work for work in works if work.id == doc.docid])
+    def _prune(self, query_embedding: list[float], candidates: CandidateSet, k: int) -> CandidateSet:
+        # candidates without a stored embedding cannot be scored, so they are kept
+        embeddings = self.publication_repository.get_embeddings_by_openalex_ids(candidates.ids)
+        scored_ids = [work_id for work_id in candidates.ids if work_id in embeddings]
+        pool = self.pruner.prune(query_embedding, [embeddings[work_id] for work_id in scored_ids], k)
+        pooled_ids = {scored_ids[i] for i in pool}
+        return candidates.select(
+            work_id for work_id in candidates.ids if work_id in pooled_ids or work_id not in embeddings
+        )
 
-        return reranked_works
+    def _rerank(self, query: str, candidates: CandidateSet | list[Work | ScoredWork], k: int = 10) -> CandidateSet:
+        if not isinstance(candidates, CandidateSet):
+            works = [work.work if isinstance(work, ScoredWork) else work for work in candidates]
+            candidates = CandidateSet((work.id for work in works), works={work.id: work for work in works})
+        reranked = self.reranking_service.rerank(query, candidates, k)
+        return candidates.select(work.id for work in reranked)
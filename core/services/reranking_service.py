@@ -0,0 +1,288 @@
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from os import environ
+
+from core.dataclasses.data_classes import Work
+from core.llm_interfaces import LLMInterface, AsyncLLMInterface
+from core.llm_interfaces.base import LLMType
+from core.llm_interfaces.tasks import SelectRelevantPassagesTask
+from utils.cache import LRUCache, SqliteStore
+
+logger = logging.getLogger(__name__)
+
+
+class JudgmentCache:
+    """
+    Cache of LLM relevance judgments, i.e. which works the LLM selected from a group of candidates. Judgments are keyed
+    by model, prompt, query and the ordered ids of the candidates, and stored in a local SQLite database with an
+    in-memory LRU cache in front of it. Both evict entries after ttl seconds.
+    """
+
+    def __init__(self, path: str = None, memory_cache_size: int = 10_000, ttl: float = 7 * 24 * 60 * 60):
+        """
+        Parameters:
+            path: Path of the SQLite database. Defaults to $JUDGMENT_CACHE_PATH or .cache/judgments.sqlite3.
+            memory_cache_size: Maximum number of judgments kept in memory.
+            ttl: Time-to-live of judgments in seconds. Judgments never expire if None.
+        """
+        if path is None:
+            path = environ.get("JUDGMENT_CACHE_PATH", ".cache/judgments.sqlite3")
+        self.store = SqliteStore(path, table="judgment", ttl=ttl)
+        self.memory_cache = LRUCache(memory_cache_size, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    @staticmethod
+    def key(model: str, task: SelectRelevantPassagesTask, work_ids: list[int]) -> str:
+        # the prompt template is part of the key, so that changing it invalidates the cached judgments
+        prompt = [message.content for message in task.prompt_templates[LLMType.GPT].values()]
+        query_hash = hashlib.sha256(task.query.encode("utf-8")).hexdigest()
+        candidates = json.dumps([prompt, task.num_selected, work_ids])
+        return f"{model}:{query_hash}:{hashlib.sha256(candidates.encode('utf-8')).hexdigest()}"
+
+    def get(self, key: str) -> list[int] | None:
+        selected = self.memory_cache.get(key)
+        if selected is None:
+            value = self.store.get(key)
+            if value is not None:
+                selected = json.loads(value)
+                self.memory_cache.put(key, selected)
+        with self._stats_lock:
+            if selected is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return selected
+
+    def put(self, key: str, selected: list[int]):
+        self.memory_cache.put(key, selected)
+        self.store.put(key, json.dumps(selected).encode("utf-8"))
+
+
+class RerankingService:
+    """
+    LLM reranking as a selection tournament. The candidates are split into groups, the LLM selects the k most relevant
+    candidates of each group (most relevant first) and only these advance to the next round, until a single group is
+    left, whose selection is the final ranking. A group never drops a candidate that is more relevant than one of the
+    candidates it selects, so the true top k always advance (for consistent judgments).
+
+    The comparisons of a round are independent of each other and run concurrently, so the latency grows with the number
+    of rounds, about log2(len(works) / k), instead of the number of comparisons, as with heapsort. rerank runs them on
+    a thread pool, rerank_async on the event loop, via the async LLM interface.
+
+    With a JudgmentCache, only judgments of groups that were not judged before for the same query are requested from
+    the LLM. Candidates are grouped in the order of their ids, which grow over time, so that a rerun over mostly the
+    same candidates (e.g. a daily digest with a few new works) reproduces most groups of the previous run.
+    """
+
+    def __init__(
+        self,
+        llm_interface: LLMInterface,
+        model: str = "gpt-4o-mini-2024-07-18",
+        group_size: int = 20,
+        max_concurrency: int = 8,
+        judgment_cache: JudgmentCache = None,
+        async_llm_interface: AsyncLLMInterface = None,
+    ):
+        """
+        Parameters:
+            llm_interface: The LLM interface used for the comparisons.
+            model: The model used for the comparisons.
+            group_size: Maximum number of candidates compared in one LLM call. Raised to 2 * k if smaller, so that every
+                round at least halves the candidates.
+            max_concurrency: Default maximum number of comparisons requested from the LLM at the same time.
+            judgment_cache: Optional cache of judgments, can be shared with other rerankers.
+            async_llm_interface: The LLM interface used for the comparisons of rerank_async.
+        """
+        if group_size < 2:
+            raise ValueError("group_size must be at least 2.")
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1.")
+        self.llm_interface = llm_interface
+        self.model = model
+        self.group_size = group_size
+        self.max_concurrency = max_concurrency
+        self.judgment_cache = judgment_cache
+        self.async_llm_interface = async_llm_interface
+
+    def rerank(self, query: str, works: Sequence[Work], k: int = 10, max_concurrency: int = None) -> list[Work]:
+        """
+        Rerank the works with regard to the query.
+
+        Parameters:
+            query: The query to judge relevance for.
+            works: The candidate works, in retrieval order, e.g. a CandidateSet. All works must have abstracts.
+            k: Number of works to return.
+            max_concurrency: Maximum number of concurrent LLM calls. Defaults to the value set on the service.
+
+        Returns:
+            list[Work]: The k most relevant works, most relevant first.
+        """
+        max_concurrency = self._check_arguments(works, k, max_concurrency)
+        if len(works) <= 1:
+            return works[:k]
+
+        group_size = max(self.group_size, 2 * k)
+        # indices of the remaining candidates, sorted by work id in the first round and in the order of the previous
+        # round's selections afterwards
+        remaining = sorted(range(len(works)), key=lambda i: works[i].id)
+        num_rounds = 0
+        num_calls = 0
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            while True:
+                groups = self._groups(remaining, group_size)
+                final = len(groups) == 1
+                # executor.map yields results in the order of the groups
+                selections = list(
+                    executor.map(lambda group: self._select(query, works, group, min(k, len(group)), final), groups)
+                )
+                num_rounds += 1
+                num_calls += sum(calls for _, calls in selections)
+                if final:
+                    ranking = selections[0][0]
+                    break
+                remaining = [i for selection, _ in selections for i in selection]
+
+        logger.info(
+            f"Reranked {len(works)} works in {time.perf_counter() - start:.2f}s ({num_calls} LLM calls in {num_rounds} "
+            f"rounds, max_concurrency={max_concurrency})"
+        )
+        return [works[i] for i in ranking]
+
+    async def rerank_async(
+        self, query: str, works: Sequence[Work], k: int = 10, max_concurrency: int = None
+    ) -> list[Work]:
+        """
+        Asynchronous variant of rerank, using the async LLM interface instead of a thread pool, so that many rerankings
+        can share one event loop. Grouping, results and failure handling are the same as for the synchronous variant.
+        """
+        if self.async_llm_interface is None:
+            raise ValueError("An AsyncLLMInterface is required for asynchronous reranking.")
+        max_concurrency = self._check_arguments(works, k, max_concurrency)
+        if len(works) <= 1:
+            return works[:k]
+
+        group_size = max(self.group_size, 2 * k)
+        remaining = sorted(range(len(works)), key=lambda i: works[i].id)
+        semaphore = asyncio.Semaphore(max_concurrency)
+        num_rounds = 0
+        num_calls = 0
+
+        async def judge(task: SelectRelevantPassagesTask, group: list[int]) -> list[int]:
+            async with semaphore:
+                try:
+                    response = await self.async_llm_interface.create_completion(
+                        task.get_prompt(LLMType.GPT), self.model
+                    )
+                    return [group[i] for i in task.parse_response(response)]
+                except Exception as e:
+                    logger.warning(f"Comparison of {len(group)} works failed, keeping their input order: {e!r}")
+                    return []
+
+        start = time.perf_counter()
+        while True:
+            groups = self._groups(remaining, group_size)
+            final = len(groups) == 1
+            num_selected = [min(k, len(group)) for group in groups]
+
+            def prepare() -> list[tuple[list[int] | None, SelectRelevantPassagesTask | None, str | None]]:
+                return [self._prepare_selection(query, works, *args, final) for args in zip(groups, num_selected)]
+
+            # the judgment cache is a local database, accessed in a worker thread to not block the event loop
+            prepared = await asyncio.to_thread(prepare) if self.judgment_cache is not None else prepare()
+            judged = [(i, task) for i, (_, task, _) in enumerate(prepared) if task is not None]
+            # gather returns the results in the order of the awaitables
+            responses = await asyncio.gather(*(judge(task, groups[i]) for i, task in judged))
+
+            def complete() -> list[list[int]]:
+                selections = [selected for selected, _, _ in prepared]
+                for (i, _), selected in zip(judged, responses):
+                    selections[i] = self._complete_selection(
+                        works, groups[i], num_selected[i], selected, prepared[i][2]
+                    )
+                return selections
+
+            selections = await asyncio.to_thread(complete) if self.judgment_cache is not None else complete()
+            num_rounds += 1
+            num_calls += len(judged)
+            if final:
+                ranking = selections[0]
+                break
+            remaining = [i for selection in selections for i in selection]
+
+        logger.info(
+            f"Reranked {len(works)} works in {time.perf_counter() - start:.2f}s ({num_calls} LLM calls in {num_rounds} "
+            f"rounds, max_concurrency={max_concurrency})"
+        )
+        return [works[i] for i in ranking]
+
+    def _check_arguments(self, works: Sequence[Work], k: int, max_concurrency: int | None) -> int:
+        # Returns the maximum concurrency to use.
+        if max_concurrency is None:
+            max_concurrency = self.max_concurrency
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1.")
+        if k < 1:
+            raise ValueError("k must be at least 1.")
+        if not all(work.abstract for work in works):
+            raise ValueError("All works must have abstracts for reranking.")
+        return max_concurrency
+
+    @staticmethod
+    def _groups(remaining: list[int], group_size: int) -> list[list[int]]:
+        # contiguous groups, so that a change of the candidates only changes the groups containing it
+        return [remaining[i : i + group_size] for i in range(0, len(remaining), group_size)]
+
+    def _select(
+        self, query: str, works: Sequence[Work], group: list[int], num_selected: int, final: bool
+    ) -> tuple[list[int], int]:
+        # Returns the indices of the selected works and the number of LLM calls made.
+        selected, task, key = self._prepare_selection(query, works, group, num_selected, final)
+        if task is None:
+            return selected, 0
+        try:
+            response = self.llm_interface.create_completion(task.get_prompt(LLMType.GPT), self.model)
+            selected = [group[i] for i in task.parse_response(response)]
+        except Exception as e:
+            logger.warning(f"Comparison of {len(group)} works failed, keeping their input order: {e!r}")
+            selected = []
+        return self._complete_selection(works, group, num_selected, selected, key), 1
+
+    def _prepare_selection(
+        self, query: str, works: Sequence[Work], group: list[int], num_selected: int, final: bool
+    ) -> tuple[list[int] | None, SelectRelevantPassagesTask | None, str | None]:
+        # Returns the selection if it needs no LLM call, because it is trivial or cached. Otherwise, returns the task
+        # to send to the LLM and its key in the judgment cache.
+        if len(group) == 1 or (len(group) <= num_selected and not final):
+            # all candidates advance, their order only matters in the final round
+            return group, None, None
+
+        task = SelectRelevantPassagesTask(query, [works[i].abstract for i in group], num_selected)
+        key = None
+        if self.judgment_cache is not None:
+            key = JudgmentCache.key(self.model, task, [works[i].id for i in group])
+            selected_ids = self.judgment_cache.get(key)
+            if selected_ids is not None:
+                index_by_id = {works[i].id: i for i in group}
+                return [index_by_id[work_id] for work_id in selected_ids], None, None
+        return None, task, key
+
+    def _complete_selection(
+        self, works: Sequence[Work], group: list[int], num_selected: int, selected: list[int], key: str | None
+    ) -> list[int]:
+        # If the comparison failed, or the response selects too few works, the selection is completed in input order,
+        # so that a single bad response does not abort the reranking. Such incomplete judgments are not cached.
+        if len(selected) < num_selected:
+            selected.extend(sorted(i for i in group if i not in selected)[: num_selected - len(selected)])
+        elif key is not None:
+            self.judgment_cache.put(key, [works[i].id for i in selected])
+        return selected
@@ -1,32 +1,258 @@
+import asyncio
+import hashlib
 import json
+import logging
+import time
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from os import environ
 
 from core.dataclasses.data_classes import Work, SummarizedWork
-from core.llm_interfaces import LLMInterface
+from core.llm_interfaces import LLMInterface, AsyncLLMInterface
 from core.llm_interfaces.tasks import CustomizedSummaryTask
+from utils.cache import SqliteStore
+
+logger = logging.getLogger(__name__)
+
+
+class SummaryStore:
+    """
+    Persistent store of generated summaries, so that a work is only summarized once for the same research interest,
+    e.g. in consecutive digests. Summaries are keyed by the version of the summary prompt templates, the model, a hash
+    of the query and the work id, and stored in a local SQLite database. Summaries generated with other templates are
+    never read, invalidate deletes them (e.g. via `python setup/maintenance.py purge-summaries`).
+    """
+
+    def __init__(self, path: str = None, ttl: float = None):
+        """
+        Parameters:
+            path: Path of the SQLite database. Defaults to $SUMMARY_STORE_PATH or .cache/summaries.sqlite3.
+            ttl: Time-to-live of summaries in seconds. Summaries never expire if None.
+        """
+        if path is None:
+            path = environ.get("SUMMARY_STORE_PATH", ".cache/summaries.sqlite3")
+        self.store = SqliteStore(path, table="summary", ttl=ttl)
+
+    @staticmethod
+    def key(query: str, work_id: int, model: str, template_version: str = None) -> str:
+        if template_version is None:
+            template_version = CustomizedSummaryTask.template_version()
+        query_hash = hashlib.sha256(" ".join(query.split()).encode("utf-8")).hexdigest()
+        # the template version comes first, so that the summaries of other versions can be deleted by prefix
+        return f"{template_version}:{model}:{query_hash}:{work_id}"
+
+    def get_many(self, keys: list[str]) -> dict[str, str]:
+        return {key: value.decode("utf-8") for key, value in self.store.get_many(keys).items()}
+
+    def put_many(self, items: dict[str, str]):
+        self.store.put_many((key, summary.encode("utf-8")) for key, summary in items.items())
+
+    def invalidate(self, template_version: str = None) -> int:
+        """
+        Delete the summaries generated with other prompt templates than the given version (by default the current
+        one), as well as expired summaries. Returns the number of deleted summaries.
+        """
+        if template_version is None:
+            template_version = CustomizedSummaryTask.template_version()
+        return self.store.delete_without_prefix(f"{template_version}:") + self.store.delete_expired()
+
+    def clear(self):
+        self.store.clear()
+
+    def __len__(self) -> int:
+        return len(self.store)
 
 
 class SummarizationService:
     def __init__(
         self,
         llm_interface: LLMInterface,
+        max_concurrency: int = 4,
+        async_llm_interface: AsyncLLMInterface = None,
+        summary_store: SummaryStore = None,
     ):
+        """
+        Parameters:
+            llm_interface: The LLM interface used to generate the summaries.
+            max_concurrency: Default maximum number of summaries requested from the LLM at the same time.
+            async_llm_interface: Optional async LLM interface, required for summarize_works_for_query_async.
+            summary_store: Optional store of previously generated summaries. Stored summaries are returned without
+                calling the LLM, new summaries are added to the store.
+        """
         self.llm_interface = llm_interface
+        self.max_concurrency = max_concurrency
+        self.async_llm_interface = async_llm_interface
+        self.summary_store = summary_store
+
+    def summarize_works_for_query(
+        self, query: str, works: Iterable[Work], max_concurrency: int = None
+    ) -> list[SummarizedWork]:
+        """
+        Summarize the given works with regard to the query. Summaries are requested concurrently, with at most
+        max_concurrency requests in flight. The result preserves the order of the input works. Works for which
+        summarization fails (e.g. due to a malformed response) are logged and omitted from the result.
+
+        Parameters:
+            query: Description of the research interest to which the summaries should be customized.
+            works: The works to summarize, e.g. a CandidateSet. Works without abstracts are skipped.
+            max_concurrency: Maximum number of concurrent LLM calls. Defaults to the value set on the service.
+
+        Returns:
+            list[SummarizedWork]: The successfully summarized works, in input order.
+        """
+        if max_concurrency is None:
+            max_concurrency = self.max_concurrency
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1.")
 
-    def summarize_works_for_query(self, query: str, works: list[Work]) -> list[SummarizedWork]:
         # only consider works with abstracts
         works_with_abstracts = [work for work in works if work.abstract]
+        if not works_with_abstracts:
+            return []
+
+        start = time.perf_counter()
+        model = self._summary_model(self.llm_interface, query, works_with_abstracts[0])
+        stored, missing_works = self._lookup(query, works_with_abstracts, model)
+        if max_concurrency == 1 or len(missing_works) <= 1:
+            results = [self._try_summarize_work(query, work) for work in missing_works]
+        else:
+            with ThreadPoolExecutor(max_workers=min(max_concurrency, len(missing_works))) as executor:
+                # executor.map yields results in input order, regardless of completion order
+                results = list(executor.map(lambda work: self._try_summarize_work(query, work), missing_works))
+        self._store(query, results, model)
+        total_latency = time.perf_counter() - start
+
+        return self._collect_results(works_with_abstracts, stored, results, total_latency, max_concurrency)
+
+    async def summarize_works_for_query_async(
+        self, query: str, works: Iterable[Work], max_concurrency: int = None
+    ) -> list[SummarizedWork]:
+        """
+        Asynchronous variant of summarize_works_for_query, using the async LLM interface instead of a thread pool.
+        Concurrency, ordering and failure handling are the same as for the synchronous variant.
+        """
+        if self.async_llm_interface is None:
+            raise ValueError("An AsyncLLMInterface is required for asynchronous summarization.")
+        if max_concurrency is None:
+            max_concurrency = self.max_concurrency
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1.")
+
+        works_with_abstracts = [work for work in works if work.abstract]
+        if not works_with_abstracts:
+            return []
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def try_summarize_work(work: Work) -> tuple[SummarizedWork | None, float]:
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await self.async_llm_interface.handle_task(self._create_task(query, work))
+                    summarized_work = self._parse_response(work, response)
+                except Exception as e:
+                    latency = time.perf_counter() - start
+                    logger.warning(f"Failed to summarize work {work.openalex_url()} after {latency:.2f}s: {e!r}")
+                    return None, latency
+                latency = time.perf_counter() - start
+                logger.debug(f"Summarized work {work.openalex_url()} in {latency:.2f}s")
+                return summarized_work, latency
+
+        start = time.perf_counter()
+        model = self._summary_model(self.async_llm_interface, query, works_with_abstracts[0])
+        # the store is a local database, accessed in a worker thread to not block the event loop
+        stored, missing_works = await asyncio.to_thread(self._lookup, query, works_with_abstracts, model)
+        # gather returns results in the order of the awaitables
+        results = await asyncio.gather(*(try_summarize_work(work) for work in missing_works))
+        await asyncio.to_thread(self._store, query, results, model)
+        total_latency = time.perf_counter() - start
 
-        summarized_works: list[SummarizedWork] = []
-        for work in works_with_abstracts:
-            task = CustomizedSummaryTask(
-                area_of_research=query,
-                abstract=work.abstract,
-                prioritize_quality=True,
-            )
-            response = self.llm_interface.handle_task(task)
-            reasoning_structure_json = response.strip("```json").strip("```")
-            reasoning_structure = json.loads(reasoning_structure_json)["Reasoning Structure"]
-            summary = reasoning_structure["FINAL_ANSWER"]
-            summarized_works.append(SummarizedWork(work, summary))
+        return self._collect_results(works_with_abstracts, stored, results, total_latency, max_concurrency)
 
+    def _summary_model(self, llm_interface: LLMInterface | AsyncLLMInterface, query: str, work: Work) -> str | None:
+        # the model is part of the key of stored summaries, so it is only resolved if summaries are stored
+        if self.summary_store is None:
+            return None
+        return llm_interface.model_for_task(self._create_task(query, work))
+
+    def _lookup(self, query: str, works: list[Work], model: str | None) -> tuple[dict[int, SummarizedWork], list[Work]]:
+        # Returns the stored summaries by work id and the works that still need to be summarized.
+        if self.summary_store is None:
+            return {}, works
+        keys = {work.id: SummaryStore.key(query, work.id, model) for work in works}
+        summaries = self.summary_store.get_many(list(keys.values()))
+        stored = {
+            work.id: SummarizedWork(work, summaries[keys[work.id]]) for work in works if keys[work.id] in summaries
+        }
+        return stored, [work for work in works if work.id not in stored]
+
+    def _store(self, query: str, results: list[tuple[SummarizedWork | None, float]], model: str | None):
+        if self.summary_store is None:
+            return
+        self.summary_store.put_many(
+            {
+                SummaryStore.key(query, summarized_work.work.id, model): summarized_work.summary
+                for summarized_work, _ in results
+                if summarized_work is not None
+            }
+        )
+
+    @staticmethod
+    def _collect_results(
+        works: list[Work],
+        stored: dict[int, SummarizedWork],
+        results: list[tuple[SummarizedWork | None, float]],
+        total_latency: float,
+        max_concurrency: int,
+    ) -> list[SummarizedWork]:
+        summarized = dict(stored)
+        summarized.update(
+            (summarized_work.work.id, summarized_work) for summarized_work, _ in results if summarized_work is not None
+        )
+        # stored and newly generated summaries, in the order of the works
+        summarized_works = [summarized[work.id] for work in works if work.id in summarized]
+        call_latencies = [latency for _, latency in results]
+        latency_info = (
+            f", mean call latency: {sum(call_latencies) / len(call_latencies):.2f}s, "
+            f"max call latency: {max(call_latencies):.2f}s"
+            if call_latencies
+            else ""
+        )
+        logger.info(
+            f"Summarized {len(summarized_works)} of {len(works)} works in {total_latency:.2f}s ({len(stored)} from the "
+            f"summary store, max_concurrency={max_concurrency}{latency_info})"
+        )
         return summarized_works
+
+    def _try_summarize_work(self, query: str, work: Work) -> tuple[SummarizedWork | None, float]:
+        # Isolates failures of a single work, so that one bad response does not abort the whole batch.
+        # Returns the summarized work (or None on failure) together with the latency of the call in seconds.
+        start = time.perf_counter()
+        try:
+            summarized_work = self._summarize_work(query, work)
+        except Exception as e:
+            latency = time.perf_counter() - start
+            logger.warning(f"Failed to summarize work {work.openalex_url()} after {latency:.2f}s: {e!r}")
+            return None, latency
+        latency = time.perf_counter() - start
+        logger.debug(f"Summarized work {work.openalex_url()} in {latency:.2f}s")
+        return summarized_work, latency
+
+    def _summarize_work(self, query: str, work: Work) -> SummarizedWork:
+        response = self.llm_interface.handle_task(self._create_task(query, work))
+        return self._parse_response(work, response)
+
+    @staticmethod
+    def _create_task(query: str, work: Work) -> CustomizedSummaryTask:
+        return CustomizedSummaryTask(
+            area_of_research=query,
+            abstract=work.abstract,
+            prioritize_quality=True,
+        )
+
+    @staticmethod
+    def _parse_response(work: Work, response: str) -> SummarizedWork:
+        reasoning_structure_json = response.strip("```json").strip("```")
+        reasoning_structure = json.loads(reasoning_structure_json)["Reasoning Structure"]
+        summary = reasoning_structure["FINAL_ANSWER"]
+        return SummarizedWork(work, summary)
@@ -4,3 +4,6 @@ from .openalex.field import Field
 from .openalex.subfield import Subfield
 from .openalex.topic import Topic
 from .publication import Publication
+from .bm25_statistics import Bm25Statistics
+from .harvest_checkpoint import HarvestCheckpoint
+from .sync_state import SyncState
@@ -0,0 +1,23 @@
+from datetime import datetime
+
+from sqlalchemy import Integer, BigInteger, Float, DateTime
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+
+
+class Bm25Statistics(Base):
+    """
+    Corpus statistics at the time the BM25 vectors of all publications were last computed, plus running totals of the
+    publications vectorized incrementally since then. Used to decide when a full BM25 refresh is due. Has a single row.
+    """
+
+    __tablename__ = "publication_bm25_statistics"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    document_count: Mapped[int] = mapped_column(BigInteger)
+    # average abstract length in characters, a proxy for the average document length used by BM25
+    average_length: Mapped[float] = mapped_column(Float)
+    documents_since_refresh: Mapped[int] = mapped_column(BigInteger, default=0)
+    length_since_refresh: Mapped[int] = mapped_column(BigInteger, default=0)
+    refreshed_datetime_utc: Mapped[datetime] = mapped_column(DateTime(timezone=True))
@@ -0,0 +1,25 @@
+from datetime import date, datetime
+
+from sqlalchemy import Integer, BigInteger, String, Date, DateTime
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+
+
+class HarvestCheckpoint(Base):
+    """
+    Progress of an interrupted harvest of works from OpenAlex (see PublicationService.initialize_for_query), committed
+    together with the harvested publications. Deleted once the harvest is complete.
+    """
+
+    __tablename__ = "openalex_harvest_checkpoint"
+
+    # hash of the harvest's parameters
+    key: Mapped[str] = mapped_column(String, primary_key=True)
+    # cursor of the first page that has not been committed yet
+    next_cursor: Mapped[str] = mapped_column(String)
+    # end of the publication date window, kept fixed so that the cursor stays valid when resuming on a later day
+    to_publication_date: Mapped[date] = mapped_column(Date)
+    works_harvested: Mapped[int] = mapped_column(Integer)
+    last_work_id: Mapped[int] = mapped_column(BigInteger, nullable=True)
+    updated_datetime_utc: Mapped[datetime] = mapped_column(DateTime(timezone=True))
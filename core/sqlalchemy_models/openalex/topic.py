@@ -1,4 +1,4 @@
-from sqlalchemy import Integer, String, ForeignKey, ARRAY
+from sqlalchemy import Integer, String, ForeignKey, ARRAY, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .base import OpenAlexBase
@@ -6,6 +6,16 @@ from .base import OpenAlexBase
 
 class Topic(OpenAlexBase):
     __tablename__ = "openalex_topic"
+    __table_args__ = (
+        # approximate nearest neighbor index for topic matching, see core/repositories/vector_index.py
+        Index(
+            "openalex_topic_embedding_hnsw_idx",
+            "embedding",
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"embedding": "vector_cosine_ops"},
+        ),
+    )
 
     keywords: Mapped[[str]] = mapped_column(ARRAY(String, dimensions=1))
 
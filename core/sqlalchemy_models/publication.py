@@ -1,7 +1,8 @@
 from datetime import datetime
 
 from pgvector.sqlalchemy import Vector, SPARSEVEC
-from sqlalchemy import Integer, BigInteger, String, DateTime, ARRAY
+from sqlalchemy import Integer, BigInteger, String, DateTime, ARRAY, Index, text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, mapped_column
 
 from .base import Base
@@ -9,6 +10,20 @@ from .base import Base
 
 class Publication(Base):
     __tablename__ = "publication"
+    __table_args__ = (
+        # approximate nearest neighbor index for semantic search, see core/repositories/vector_index.py
+        Index(
+            "publication_embedding_hnsw_idx",
+            "embedding",
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"embedding": "vector_cosine_ops"},
+        ),
+        # locates the rows within a date window for date-filtered search
+        Index("publication_publication_datetime_utc_idx", "publication_datetime_utc"),
+        # locates the publications whose BM25 vector still has to be computed, see PublicationRepository.update_bm25
+        Index("publication_bm25_missing_idx", "id", postgresql_where=text("bm25 IS NULL")),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     openalex_id: Mapped[int] = mapped_column(BigInteger, unique=True)  # OpenAlex ids are too large for an Integer
@@ -19,3 +34,8 @@ class Publication(Base):
     abstract: Mapped[str] = mapped_column(String, nullable=True)
     bm25: Mapped[list[float]] = mapped_column(SPARSEVEC, nullable=True)
     embedding: Mapped[list[float]] = mapped_column(Vector(1024))
+    # OpenAlex metadata, so that works can be served from the database (see Work.from_publication)
+    # topics are stored like Work.topics: {topic_id: {"name": ..., "score": ...}}
+    topics: Mapped[dict] = mapped_column(JSONB, nullable=True)
+    cited_by_count: Mapped[int] = mapped_column(Integer, nullable=True)
+    created_datetime_utc: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=True)
@@ -0,0 +1,23 @@
+from datetime import date, datetime
+
+from sqlalchemy import Integer, String, Date, DateTime, ARRAY
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+
+
+class SyncState(Base):
+    """
+    Newest works harvested from OpenAlex for a set of topics, so that a refresh only has to query newer works
+    (see PublicationService.initialize_for_query).
+    """
+
+    __tablename__ = "openalex_sync_state"
+
+    # hash of the sorted topic ids
+    key: Mapped[str] = mapped_column(String, primary_key=True)
+    topic_ids: Mapped[list[int]] = mapped_column(ARRAY(Integer, dimensions=1))
+    # watermark for refreshes, OpenAlex only allows filtering by creation date with a premium API key
+    latest_publication_date: Mapped[date] = mapped_column(Date)
+    latest_created_date: Mapped[date] = mapped_column(Date, nullable=True)
+    synced_datetime_utc: Mapped[datetime] = mapped_column(DateTime(timezone=True))
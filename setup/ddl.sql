@@ -24,6 +24,9 @@ CREATE TABLE publication (
 	abstract VARCHAR, 
 	bm25 SPARSEVEC, 
 	embedding VECTOR(1024) NOT NULL, 
+	topics JSONB, 
+	cited_by_count INTEGER, 
+	created_datetime_utc TIMESTAMP WITH TIME ZONE, 
 	PRIMARY KEY (id), 
 	UNIQUE (openalex_id)
 );
@@ -70,3 +73,42 @@ CREATE TABLE openalex_topic (
 	FOREIGN KEY(subfield_id) REFERENCES openalex_subfield (id)
 );
 
+
+CREATE TABLE openalex_harvest_checkpoint (
+	key VARCHAR NOT NULL, 
+	next_cursor VARCHAR NOT NULL, 
+	to_publication_date DATE NOT NULL, 
+	works_harvested INTEGER NOT NULL, 
+	last_work_id BIGINT, 
+	updated_datetime_utc TIMESTAMP WITH TIME ZONE NOT NULL, 
+	PRIMARY KEY (key)
+);
+
+
+CREATE TABLE openalex_sync_state (
+	key VARCHAR NOT NULL, 
+	topic_ids INTEGER[] NOT NULL, 
+	latest_publication_date DATE NOT NULL, 
+	latest_created_date DATE, 
+	synced_datetime_utc TIMESTAMP WITH TIME ZONE NOT NULL, 
+	PRIMARY KEY (key)
+);
+
+
+CREATE TABLE publication_bm25_statistics (
+	id SERIAL NOT NULL, 
+	document_count BIGINT NOT NULL, 
+	average_length FLOAT NOT NULL, 
+	documents_since_refresh BIGINT NOT NULL, 
+	length_since_refresh BIGINT NOT NULL, 
+	refreshed_datetime_utc TIMESTAMP WITH TIME ZONE NOT NULL, 
+	PRIMARY KEY (id)
+);
+
+CREATE INDEX publication_embedding_hnsw_idx ON publication USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64);
+
+CREATE INDEX openalex_topic_embedding_hnsw_idx ON openalex_topic USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64);
+
+CREATE INDEX publication_publication_datetime_utc_idx ON publication (publication_datetime_utc);
+
+CREATE INDEX publication_bm25_missing_idx ON publication (id) WHERE bm25 IS NULL;
@@ -0,0 +1,135 @@
+import argparse
+
+from core.repositories import VectorIndexType
+from core.repositories.publication_repository import PublicationRepository
+from core.repositories.vector_index import build_vector_index, drop_vector_index
+from core.services.reranking_service import JudgmentCache
+from core.services.summarization_service import SummaryStore
+from db import Session
+
+# tables with embedding columns that are searched by similarity
+VECTOR_TABLES = ["publication", "openalex_topic"]
+
+
+def build_indexes(index_type: VectorIndexType, concurrently: bool, maintenance_work_mem: str | None, bm25: bool):
+    with Session() as session:
+        for table in VECTOR_TABLES:
+            print(f"Building {index_type.value} index on {table}.embedding ...")
+            build_vector_index(
+                session,
+                table,
+                index_type=index_type,
+                concurrently=concurrently,
+                maintenance_work_mem=maintenance_work_mem,
+            )
+        if bm25:
+            print("Building hnsw index on publication.bm25 ...")
+            PublicationRepository(session).build_bm25_index(concurrently, maintenance_work_mem=maintenance_work_mem)
+    print("Indexes built.")
+
+
+def drop_indexes(index_type: VectorIndexType, concurrently: bool, bm25: bool):
+    with Session() as session:
+        for table in VECTOR_TABLES:
+            print(f"Dropping {index_type.value} index on {table}.embedding ...")
+            drop_vector_index(session, table, index_type=index_type, concurrently=concurrently)
+        if bm25:
+            print("Dropping hnsw index on publication.bm25 ...")
+            PublicationRepository(session).drop_bm25_index(concurrently)
+    print("Indexes dropped.")
+
+
+def refresh_bm25(full: bool, drift_threshold: float | None):
+    with Session() as session:
+        repository = PublicationRepository(session)
+        if full:
+            print("Recomputing BM25 statistics and vectors of all publications ...")
+            repository.rebuild_bm25()
+        else:
+            print("Updating BM25 vectors ...")
+            if repository.update_bm25(drift_threshold):
+                print("Recomputed BM25 statistics and vectors of all publications.")
+    print("BM25 vectors are up to date.")
+
+
+def purge_summaries(purge_all: bool):
+    store = SummaryStore()
+    if purge_all:
+        print(f"Deleting all {len(store)} stored summaries ...")
+        store.clear()
+    else:
+        print("Deleting stored summaries generated with outdated prompt templates or expired ...")
+        print(f"Deleted {store.invalidate()} summaries.")
+    print(f"{len(store)} summaries are stored.")
+
+
+def purge_judgments(purge_all: bool):
+    store = JudgmentCache().store
+    if purge_all:
+        print(f"Deleting all {len(store)} cached reranking judgments ...")
+        store.clear()
+    else:
+        print("Deleting expired reranking judgments ...")
+        print(f"Deleted {store.delete_expired()} judgments.")
+    print(f"{len(store)} judgments are cached.")
+
+
+if __name__ == "__main__":
+    # Set up command-line argument parsing
+    parser = argparse.ArgumentParser(description="Database maintenance tasks.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    for command, help_text in (
+        ("build-indexes", "Build the ANN indexes on embedding columns, e.g. after a bulk ingestion."),
+        ("drop-indexes", "Drop the ANN indexes on embedding columns, e.g. before a large bulk ingestion."),
+    ):
+        subparser = subparsers.add_parser(command, help=help_text)
+        subparser.add_argument("--type", choices=[t.value for t in VectorIndexType], default="hnsw")
+        subparser.add_argument(
+            "--blocking", action="store_true", help="Don't use CONCURRENTLY (faster, but blocks writes)."
+        )
+        subparser.add_argument(
+            "--bm25", action="store_true", help="Include the HNSW index on the BM25 vectors of publications."
+        )
+    subparsers.choices["build-indexes"].add_argument(
+        "--maintenance-work-mem", default=None, help="Memory for building the index, e.g. '2GB'."
+    )
+
+    bm25_parser = subparsers.add_parser(
+        "refresh-bm25",
+        help="Compute missing BM25 vectors and recompute all of them if the corpus statistics drifted, e.g. nightly.",
+    )
+    bm25_parser.add_argument(
+        "--full", action="store_true", help="Recompute the statistics and all vectors regardless of the drift."
+    )
+    bm25_parser.add_argument(
+        "--drift-threshold",
+        type=float,
+        default=None,
+        help=f"Relative drift that triggers a full refresh (default: {PublicationRepository.bm25_drift_threshold}).",
+    )
+
+    summaries_parser = subparsers.add_parser(
+        "purge-summaries",
+        help="Delete stored summaries that can no longer be used, e.g. after changing the summary prompt templates.",
+    )
+    summaries_parser.add_argument(
+        "--all", action="store_true", help="Delete all stored summaries, so that every summary is regenerated."
+    )
+
+    judgments_parser = subparsers.add_parser(
+        "purge-judgments", help="Delete expired reranking judgments from the judgment cache, e.g. nightly."
+    )
+    judgments_parser.add_argument("--all", action="store_true", help="Delete all cached reranking judgments.")
+
+    args = parser.parse_args()
+    if args.command == "build-indexes":
+        build_indexes(VectorIndexType(args.type), not args.blocking, args.maintenance_work_mem, args.bm25)
+    elif args.command == "drop-indexes":
+        drop_indexes(VectorIndexType(args.type), not args.blocking, args.bm25)
+    elif args.command == "refresh-bm25":
+        refresh_bm25(args.full, args.drift_threshold)
+    elif args.command == "purge-summaries":
+        purge_summaries(args.all)
+    elif args.command == "purge-judgments":
+        purge_judgments(args.all)
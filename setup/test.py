@@ -8,8 +8,8 @@ def main(query):
     start_date = datetime(2024, 1, 1)
 
     # Retrieve topics and publications for the query
-    topics, publications_retrieved_for_topics = retrieval.initialize_for_query(query=query, start_date=start_date,
-                                                                               limit=100, num_topics=10)
+    topics, added_work_ids = retrieval.initialize_for_query(query=query, start_date=start_date,
+                                                             limit=100, num_topics=10)
 
     # Get relevant works based on the query
     works = retrieval.get_relevant_works_for_query(query=query, n=5, start_date=start_date)
@@ -0,0 +1,159 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Hashable, Iterable
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory LRU cache with an optional time-to-live per entry.
+    """
+
+    def __init__(self, max_size: int, ttl: float = None):
+        """
+        Parameters:
+            max_size: Maximum number of entries; the least recently used entries are evicted first.
+            ttl: Time-to-live of entries in seconds. Entries never expire if None.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[Hashable, tuple[object, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, stored_at = entry
+            if self.ttl is not None and time.time() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: object):
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SqliteStore:
+    """
+    Persistent key-value store for binary values in a local SQLite database, with an optional time-to-live per entry.
+    The store can be shared between threads. The database file is only created when the store is first used.
+    """
+
+    # SQLite limits the number of host parameters per statement
+    _max_parameters = 900
+
+    def __init__(self, path: str, table: str = "cache", ttl: float = None):
+        """
+        Parameters:
+            path: Path of the SQLite database file. Parent directories are created if necessary.
+            table: Name of the table holding the entries, allowing multiple stores in one file.
+            ttl: Time-to-live of entries in seconds. Entries never expire if None.
+        """
+        if not table.isidentifier():
+            raise ValueError(f"Invalid table name: {table}")
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._database: sqlite3.Connection | None = None
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        # opened on first use, so that creating a store (e.g. when importing core) does not create files. Callers hold
+        # self._lock
+        if self._database is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            database = sqlite3.connect(self.path, check_same_thread=False)
+            with database:
+                database.execute("PRAGMA journal_mode=WAL")
+                database.execute(
+                    f"CREATE TABLE IF NOT EXISTS {self.table} "
+                    "(key TEXT PRIMARY KEY, value BLOB NOT NULL, stored_at REAL NOT NULL)"
+                )
+            self._database = database
+        return self._database
+
+    def _expiry_threshold(self) -> float:
+        return time.time() - self.ttl if self.ttl is not None else float("-inf")
+
+    def get(self, key: str) -> bytes | None:
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, bytes]:
+        keys = list(keys)
+        threshold = self._expiry_threshold()
+        results = {}
+        with self._lock:
+            for i in range(0, len(keys), self._max_parameters):
+                chunk = keys[i : i + self._max_parameters]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._connection.execute(
+                    f"SELECT key, value FROM {self.table} WHERE key IN ({placeholders}) AND stored_at >= ?",
+                    (*chunk, threshold),
+                ).fetchall()
+                results.update(rows)
+        return results
+
+    def put(self, key: str, value: bytes):
+        self.put_many([(key, value)])
+
+    def put_many(self, items: Iterable[tuple[str, bytes]]):
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, stored_at) VALUES (?, ?, ?)",
+                ((key, value, now) for key, value in items),
+            )
+
+    def delete(self, key: str):
+        with self._lock, self._connection:
+            self._connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def delete_without_prefix(self, prefix: str) -> int:
+        """Delete all entries whose keys do not start with prefix. Returns the number of deleted entries."""
+        with self._lock, self._connection:
+            return self._connection.execute(
+                f"DELETE FROM {self.table} WHERE substr(key, 1, ?) != ?", (len(prefix), prefix)
+            ).rowcount
+
+    def delete_expired(self) -> int:
+        with self._lock, self._connection:
+            return self._connection.execute(
+                f"DELETE FROM {self.table} WHERE stored_at < ?", (self._expiry_threshold(),)
+            ).rowcount
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute(f"DELETE FROM {self.table}")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            if self._database is not None:
+                self._database.close()
+                self._database = None